@@ -0,0 +1,111 @@
+"""
+python/bars.py的成交聚合
+1. 两个合成的aggTrades文件(第二个带表头)，用很小的chunksize分块聚合，四种bar都要和一次性groupby的结果相同
+2. 一个更大的合成aggTrades zip，在子进程中聚合，报告每秒行数和峰值内存
+
+    python benchmarks/bench_bars.py [--rows 10000000] [--chunksize 1000000]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python'))
+from bars import aggregate_trades
+from common import get_peak_rss
+
+HEADER = ['agg_trade_id', 'price', 'quantity', 'first_trade_id', 'last_trade_id', 'transact_time', 'is_buyer_maker']
+
+
+def make_agg_trades(file, rows, start_time, header=False, seed=0):
+    """
+    写一个合成的aggTrades zip，返回价格、数量和时间
+    """
+    rng = np.random.default_rng(seed)
+    times = start_time + np.cumsum(rng.integers(0, 400, rows))
+    price = np.round(100 + np.cumsum(rng.normal(0, 0.01, rows)), 2)
+    qty = np.round(rng.exponential(1, rows), 4)
+    ids = np.arange(rows)
+    df = pd.DataFrame({'a': ids, 'p': price, 'q': qty, 'f': ids, 'l': ids, 't': times, 'm': True})
+    csv_file = file.replace('.zip', '.csv')
+    df.to_csv(csv_file, index=False, header=HEADER if header else False)
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.write(csv_file, os.path.basename(csv_file))
+    os.remove(csv_file)
+    return price, qty, times
+
+
+def groupby_bars(price, qty, times, bar_type, size):
+    """
+    一次性在内存中groupby得到的bar，作为对照
+    """
+    if bar_type == 'time':
+        ids = times // size
+    else:
+        measure = {'tick': np.ones(len(price)), 'volume': qty, 'dollar': price * qty}[bar_type]
+        ids = ((np.cumsum(measure) - measure) // size).astype('int64')
+    df = pd.DataFrame({'id': ids, 'time': times, 'price': price, 'qty': qty, 'quote': price * qty})
+    group = df.groupby('id', sort=False)
+    return pd.DataFrame({
+        'open_time': group['time'].first(), 'close_time': group['time'].last(),
+        'open': group['price'].first(), 'high': group['price'].max(), 'low': group['price'].min(),
+        'close': group['price'].last(), 'volume': group['qty'].sum(), 'quote_volume': group['quote'].sum(),
+        'count': group.size(),
+    }).reset_index(drop=True)
+
+
+def check(root):
+    files = [os.path.join(root, 'X-aggTrades-2020-01.zip'), os.path.join(root, 'X-aggTrades-2020-02.zip')]
+    parts = [make_agg_trades(files[0], 50000, 1577836800000, seed=1),
+             make_agg_trades(files[1], 40000, 1580515200000, header=True, seed=2)]
+    price, qty, times = (np.concatenate(column) for column in zip(*parts))
+    for bar_type, size in [('time', 60000), ('tick', 333), ('volume', 250.0), ('dollar', 25000.0)]:
+        # 文件顺序打乱，chunksize不整除文件行数，bar要跨块和跨文件
+        bars = pd.concat([bars for _, bars in aggregate_trades(files[::-1], bar_type, size, chunksize=7777)],
+                         ignore_index=True)
+        expected = groupby_bars(price, qty, times, bar_type, size)
+        same = len(bars) == len(expected) and np.allclose(bars.astype(float).values, expected.astype(float).values, rtol=1e-9)
+        print(f'{bar_type:7s} {len(bars):6d} bars, {"same as groupby" if same else "MISMATCH"}')
+        assert same
+
+
+def aggregate(file, chunksize):
+    start = time.perf_counter()
+    rows = bars = 0
+    for read, completed in aggregate_trades([file], 'dollar', 1e6, chunksize):
+        rows += read
+        bars += len(completed)
+    elapsed = time.perf_counter() - start
+    print(f'{rows} trades -> {bars} dollar bars, chunksize {chunksize}: {rows / elapsed / 1e6:.2f}M rows/s, '
+          f'peak RSS {get_peak_rss()} MB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--chunksize', type=int, default=1_000_000)
+    parser.add_argument('--aggregate', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.aggregate:
+        aggregate(args.aggregate, args.chunksize)
+        sys.exit()
+
+    root = tempfile.mkdtemp(prefix='bench_bars_')
+    try:
+        check(root)
+        big = os.path.join(root, 'BIG-aggTrades-2020-03.zip')
+        make_agg_trades(big, args.rows, 1583020800000)
+        # 在新进程中聚合，峰值内存不包括生成数据用的内存
+        for chunksize in sorted({args.chunksize, args.chunksize // 4}):
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--aggregate', big, '--chunksize', str(chunksize)],
+                           check=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
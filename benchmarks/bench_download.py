@@ -0,0 +1,66 @@
+"""
+python/utility.download_files()的吞吐量: 对本地服务器(每个请求延迟50ms)下载合成的k线zip
+1. 不同-concurrency下每秒下载的文件数
+2. 按symbol分批调用和所有symbol一次调用的耗时
+
+    python benchmarks/bench_download.py [--latency 0.05] [--files 200]
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python'))
+import utility
+import stub_server
+
+PORT = 8765
+
+
+def get_jobs(symbol, months):
+    return [(f'data/spot/monthly/klines/{symbol}/1m/', f'{symbol}-1m-2020-{month:02d}.zip', None, None)
+            for month in range(1, months + 1)]
+
+
+def run(batches, concurrency):
+    """
+    在新的STORE_DIRECTORY中下载，每个batch调用一次download_files()，返回耗时
+    """
+    store = tempfile.mkdtemp(prefix='bench_download_')
+    os.environ['STORE_DIRECTORY'] = store
+    utility._cache = None
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for jobs in batches:
+                utility.download_files(jobs, concurrency)
+        return time.perf_counter() - start
+    finally:
+        utility._cache = None
+        shutil.rmtree(store, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--files', type=int, default=200)
+    args = parser.parse_args()
+
+    server = stub_server.start(PORT, '--latency', str(args.latency))
+    utility.BASE_URL = f'http://127.0.0.1:{PORT}/'
+    try:
+        jobs = [job for i in range(args.files // 10) for job in get_jobs(f'S{i}', 10)]
+        for concurrency in (1, 4, 16, 64):
+            elapsed = run([jobs], concurrency)
+            print(f'concurrency {concurrency:2d}: {len(jobs) / elapsed:6.1f} files/s')
+
+        symbols = [get_jobs(f'S{i}', 6) for i in range(20)]
+        per_symbol = run(symbols, 16)
+        at_once = run([[job for jobs in symbols for job in jobs]], 16)
+        print(f'20 symbols x 6 files, concurrency 16: per symbol {per_symbol:.2f}s, one call {at_once:.2f}s')
+    finally:
+        server.terminate()
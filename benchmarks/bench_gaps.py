@@ -0,0 +1,45 @@
+"""
+查找缺失k线: 旧的date_range + strftime + isin和_find_gaps的耗时，两者找到的缺失k线数要相同
+合成的1m时间序列，默认300万行，去掉4段共405根k线
+
+    python benchmarks/bench_gaps.py [--rows 3000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import binance_public_data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    args = parser.parse_args()
+
+    times = np.datetime64('2019-01-01', 'ms').astype('int64') + np.arange(args.rows + 500, dtype='int64') * 60000
+    drop = np.zeros(len(times), bool)
+    drop[[10, 11, 12, 5000, args.rows * 2 // 3]] = True
+    drop[args.rows * 5 // 6:args.rows * 5 // 6 + 400] = True
+    times = times[~drop]
+
+    data = binance_public_data.BinancePublicData()
+    start = time.perf_counter()
+    gap_start, gap_end, missing_bars = data._find_gaps(times, '1m')
+    new = time.perf_counter() - start
+    for row in zip(pd.to_datetime(gap_start, unit='ms'), pd.to_datetime(gap_end, unit='ms'), missing_bars):
+        print(*row)
+
+    series = pd.Series(pd.to_datetime(times, unit='ms'))
+    start = time.perf_counter()
+    expected = pd.date_range(start=series.min(), end=series.max(), freq='1min').strftime('%Y-%m-%d %H:%M')
+    actual = series.dt.strftime('%Y-%m-%d %H:%M')
+    missing = expected[~expected.isin(actual)]
+    old = time.perf_counter() - start
+
+    assert len(missing) == missing_bars.sum() == drop.sum()
+    print(f'{len(times)} bars, {len(missing)} missing: date_range/strftime/isin {old:.2f}s, _find_gaps {new * 1000:.1f}ms')
@@ -0,0 +1,68 @@
+"""
+清洗后数据各种格式的写入耗时、大小和读取耗时
+数据为合成的1m k线，默认4年(约210万行)，按月写入，和_clean_data一样
+
+    python benchmarks/bench_output_format.py [--years 4]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import binance_public_data
+
+FORMATS = [('csv', None), ('parquet', 'zstd'), ('parquet', None), ('arrow', 'zstd'), ('arrow', None), ('bin', None)]
+
+
+def make_klines(years):
+    rows = years * 365 * 1440
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(0, 0.05, rows))
+    return pd.DataFrame({
+        'candle_begin_time': np.datetime64('2019-01-01', 'ms') + np.arange(rows) * np.timedelta64(60000, 'ms'),
+        'open': close.round(2),
+        'high': (close + 0.1).round(2),
+        'low': (close - 0.1).round(2),
+        'close': close.round(2),
+        'volume': rng.random(rows).round(5) * 100,
+        'quote/base_asset_volume': rng.random(rows).round(6) * 1e4,
+        'num_of_trades': rng.integers(0, 1000, rows),
+        'Taker_buy_base_asset_volume': rng.random(rows).round(5),
+        'Taker_buy_quote_asset_volume': rng.random(rows).round(6),
+    })
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=4)
+    args = parser.parse_args()
+
+    df = make_klines(args.years)
+    months = df['candle_begin_time'].values.astype('datetime64[M]')
+    root = tempfile.mkdtemp(prefix='bench_output_format_')
+    try:
+        for output_format, compression in FORMATS:
+            data = binance_public_data.BinancePublicData()
+            data._BinancePublicData__output_format = output_format
+            data._BinancePublicData__compression = compression
+            symbol_path = os.path.join(root, output_format + str(compression), 'AAA')
+            os.makedirs(symbol_path)
+            file = data._get_data_file(symbol_path)
+
+            start = time.perf_counter()
+            data._write_data((month for _, month in df.groupby(months, sort=True)), file)
+            write = time.perf_counter() - start
+            size = data._get_data_size(file) if output_format in ('parquet', 'arrow') else os.path.getsize(file)
+            start = time.perf_counter()
+            rows = len(data._read_data(file))
+            read = time.perf_counter() - start
+            assert rows == len(df)
+            print(f'{output_format:8s} {str(compression):5s} write {write:6.2f}s  size {size / 1e6:7.1f} MB  read {read:6.2f}s')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,114 @@
+"""
+从zip读取k线csv并整理(_read_zip + _format_klines)的耗时和内存，价格和成交量为float64和float32时各测一次
+旧的names=[0..11] + _drop_dirty_data读取方式作为基准一起测量
+数据为一个月合成的1s k线(约268万行)，带表头；每种方式在新进程中测量，峰值内存互不影响
+
+    python benchmarks/bench_read_klines.py [--days 31]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import get_peak_rss
+
+HEADER = 'open_time,open,high,low,close,volume,close_time,quote_volume,count,taker_buy_volume,taker_buy_quote_volume,ignore\n'
+
+
+def make_zip(file, days):
+    """
+    写一个合成的1s k线zip，分块生成，不占用太多内存
+    """
+    rng = np.random.default_rng(0)
+    csv_name = os.path.basename(file).replace('.zip', '.csv')
+    start = np.datetime64('2020-01-01', 'ms').astype('int64')
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as z:
+        with z.open(csv_name, 'w', force_zip64=True) as f:
+            f.write(HEADER.encode())
+            for day in range(days):
+                times = start + (day * 86400 + np.arange(86400, dtype='int64')) * 1000
+                close = np.round(7000 + np.cumsum(rng.normal(0, 0.5, 86400)), 2)
+                volume = np.round(rng.random(86400) * 10, 6)
+                lines = [f'{t},{c},{c + 0.5:.2f},{c - 0.5:.2f},{c},{v},{t + 999},{v * c:.6f},{n},{v / 2},{v * c / 2:.6f},0\n'
+                         for t, c, v, n in zip(times.tolist(), close.tolist(), volume.tolist(), rng.integers(0, 50, 86400).tolist())]
+                f.write(''.join(lines).encode())
+
+
+def read(file, float_dtype):
+    import binance_public_data
+    data = binance_public_data.BinancePublicData()
+    data._BinancePublicData__float_dtype = float_dtype
+    start = time.perf_counter()
+    raw = data._read_zip(file)
+    read_time = time.perf_counter() - start
+    df = data._format_klines(raw)
+    total = time.perf_counter() - start
+    print(f'{float_dtype}: {len(df)} rows, read {read_time:.2f}s, read+format {total:.2f}s, '
+          f'raw {raw.memory_usage(deep=True).sum() / 2**20:.0f} MB, formatted {df.memory_usage(deep=True).sum() / 2**20:.0f} MB, '
+          f'peak RSS {get_peak_rss()} MB')
+
+
+def drop_dirty_data(df):
+    """
+    旧的_drop_dirty_data: 第一行第一个值不是时间戳时删掉第一行(表头)
+    """
+    try:
+        pd.to_datetime(df.iloc[0, 0])
+    except ValueError:
+        df = df.drop(df.index[0])
+    return df
+
+
+def read_old(file):
+    """
+    旧的读取方式: names=[0..11]读入全部12列，有表头时每一列都是字符串，去掉表头后再整理
+    旧代码直接对字符串做to_datetime(unit='ms')，新版pandas会报错，这里先转成数值，得到和新方式相同的DataFrame
+    """
+    import binance_public_data
+    data = binance_public_data.BinancePublicData()
+    start = time.perf_counter()
+    with zipfile.ZipFile(file) as z:
+        with z.open(z.namelist()[0]) as f:
+            raw = pd.read_csv(f, header=None, names=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11])
+    read_time = time.perf_counter() - start
+    raw_mb = raw.memory_usage(deep=True).sum() / 2**20
+    df = drop_dirty_data(raw).apply(pd.to_numeric)
+    df = df.rename(columns=data._BinancePublicData__columns)
+    df['candle_begin_time'] = pd.to_datetime(df['candle_begin_time_ms'], unit='ms')
+    df = df[data._BinancePublicData__list].copy()
+    total = time.perf_counter() - start
+    print(f'old names=[0..11]: {len(df)} rows, read {read_time:.2f}s, read+format {total:.2f}s, '
+          f'raw {raw_mb:.0f} MB, formatted {df.memory_usage(deep=True).sum() / 2**20:.0f} MB, '
+          f'peak RSS {get_peak_rss()} MB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--read', nargs=2, metavar=('FILE', 'FLOAT_DTYPE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.read:
+        if args.read[1] == 'old':
+            read_old(args.read[0])
+        else:
+            read(*args.read)
+        sys.exit()
+
+    root = tempfile.mkdtemp(prefix='bench_read_klines_')
+    try:
+        file = os.path.join(root, 'BTCUSDT-1s-2020-01.zip')
+        make_zip(file, args.days)
+        print(f'zip {os.path.getsize(file) / 2**20:.0f} MB')
+        for float_dtype in ('old', 'float64', 'float32'):
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--read', file, float_dtype], check=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,18 @@
+"""
+基准测试共用的函数
+"""
+import resource
+
+
+def get_peak_rss():
+    """
+    本进程的峰值内存(MB)，ru_maxrss在exec后会保留父进程的值，在子进程中测量时读/proc
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) // 1024
+    except FileNotFoundError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
@@ -0,0 +1,91 @@
+"""
+下载大文件时的内存: 本地服务器返回一个随机的大文件(默认2GB)
+1. python/utility.download_file(带checksum)的峰值内存
+2. BinancePublicData._download在不同__chunk_size下的峰值内存，以及下载完成后文件留在页缓存中的大小(需要fincore)
+每次下载在新进程中进行，峰值内存互不影响
+
+    python benchmarks/profile_download_memory.py [--size-mb 2048]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from common import get_peak_rss
+import stub_server
+
+PORT = 8790
+PATH = 'data/spot/monthly/klines/BIGUSDT/1m/'
+FILE_NAME = 'BIGUSDT-1m-2020-01.zip'
+
+
+def get_cached_mb(file):
+    """
+    文件在页缓存中的大小(MB)，没有fincore时返回None
+    """
+    if shutil.which('fincore') is None:
+        return None
+    output = subprocess.run(['fincore', '-b', '-n', '-o', 'RES', file], capture_output=True, text=True).stdout.strip()
+    return int(output or 0) / 2**20
+
+
+def profile_utility(store):
+    sys.path.insert(0, os.path.join(ROOT, 'python'))
+    os.environ['STORE_DIRECTORY'] = store
+    import utility
+    utility.BASE_URL = f'http://127.0.0.1:{PORT}/'
+    imported = get_peak_rss()
+    start = time.perf_counter()
+    size = utility.download_file(PATH, FILE_NAME, checksum=True, progress=False)
+    elapsed = time.perf_counter() - start
+    print(f'utility.download_file: {size / 2**20:.0f} MB in {elapsed:.1f}s, '
+          f'peak RSS {get_peak_rss()} MB ({imported} MB after imports)')
+
+
+def profile_download(store, chunk_size):
+    sys.path.insert(0, ROOT)
+    os.chdir(store)
+    import binance_public_data
+    imported = get_peak_rss()
+    data = binance_public_data.BinancePublicData()
+    data._BinancePublicData__data = os.path.join(store, 'data')
+    data._BinancePublicData__chunk_size = chunk_size
+    start = time.perf_counter()
+    data._download(f'http://127.0.0.1:{PORT}/{PATH}{FILE_NAME}')
+    elapsed = time.perf_counter() - start
+    file = os.path.join(store, 'data', 'spot', 'BIGUSDT', 'zip', FILE_NAME)
+    cached = get_cached_mb(file)
+    print(f'_download, chunk {chunk_size // 1024:5d} KB: {os.path.getsize(file) / 2**20:.0f} MB in {elapsed:.1f}s, '
+          f'peak RSS {get_peak_rss()} MB ({imported} MB after imports)'
+          + (f', page cache {cached:.0f} MB' if cached is not None else ''))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=2048)
+    parser.add_argument('--utility', metavar='STORE', help=argparse.SUPPRESS)
+    parser.add_argument('--download', nargs=2, metavar=('STORE', 'CHUNK_SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.utility:
+        profile_utility(args.utility)
+        sys.exit()
+    if args.download:
+        profile_download(args.download[0], int(args.download[1]))
+        sys.exit()
+
+    server = stub_server.start(PORT, '--size-mb', str(args.size_mb))
+    try:
+        runs = [['--utility']] + [['--download', str(chunk_size)] for chunk_size in (64 * 1024, 1024 * 1024, 8 * 1024 * 1024)]
+        for run in runs:
+            store = tempfile.mkdtemp(prefix='profile_download_memory_')
+            try:
+                subprocess.run([sys.executable, os.path.abspath(__file__), run[0], store, *run[1:]], check=True)
+            finally:
+                shutil.rmtree(store, ignore_errors=True)
+    finally:
+        server.terminate()
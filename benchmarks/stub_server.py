@@ -0,0 +1,143 @@
+"""
+下载基准测试用的本地服务器，代替data.binance.vision
+所有.zip路径返回同一个合成的k线zip(--size-mb时返回指定大小的随机内容，按1MB块边发边生成)
+.CHECKSUM路径返回对应的sha256，路径中带404的返回404，和真实的bucket一样支持Range和If-None-Match
+
+    python benchmarks/stub_server.py 8765 --latency 0.05
+    python benchmarks/stub_server.py 8790 --size-mb 2048
+"""
+import argparse
+import hashlib
+import http.server
+import io
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import time
+import zipfile
+
+BLOCK_SIZE = 1 << 20
+
+
+def make_zip(name, rows):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr(name.replace('.zip', '.csv'), ''.join(
+            '%d,1.0,2.0,0.5,1.5,10,%d,15,3,5,7,0\n' % (1577836800000 + i * 60000, 1577836800000 + i * 60000 + 59999)
+            for i in range(rows)))
+    return buffer.getvalue()
+
+
+class Body:
+    """
+    响应的内容: 小文件直接放在内存里，大文件用同一个随机块重复，边发边生成
+    """
+
+    def __init__(self, size_mb=None, rows=2000):
+        if size_mb:
+            self.block = os.urandom(BLOCK_SIZE)
+            self.size = size_mb * BLOCK_SIZE
+            sha256 = hashlib.sha256()
+            for _ in range(size_mb):
+                sha256.update(self.block)
+            self.digest = sha256.hexdigest()
+        else:
+            self.block = make_zip('X-1m-2020-01.zip', rows)
+            self.size = len(self.block)
+            self.digest = hashlib.sha256(self.block).hexdigest()
+        self.etag = '"%s"' % self.digest[:32]
+
+    def write(self, out, offset=0):
+        block = len(self.block)
+        position = offset
+        while position < self.size:
+            start = position % block
+            end = min(block, start + self.size - position)
+            out.write(self.block[start:end])
+            position += end - start
+
+
+def make_handler(body, latency):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_HEAD(self):
+            self.do_GET(head=True)
+
+        def do_GET(self, head=False):
+            time.sleep(latency)
+            if '404' in self.path:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if self.path.endswith('.CHECKSUM'):
+                text = ('%s  %s\n' % (body.digest, self.path.split('/')[-1][:-len('.CHECKSUM')])).encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(text)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(text)
+                return
+            if self.headers.get('If-None-Match') == body.etag:
+                self.send_response(304)
+                self.send_header('ETag', body.etag)
+                self.end_headers()
+                return
+
+            offset = 0
+            requested = self.headers.get('Range', '')
+            if requested.startswith('bytes=') and requested.endswith('-'):
+                offset = int(requested[len('bytes='):-1])
+                if offset >= body.size:
+                    self.send_response(416)
+                    self.send_header('Content-Range', 'bytes */%d' % body.size)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes %d-%d/%d' % (offset, body.size - 1, body.size))
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(body.size - offset))
+            self.send_header('ETag', body.etag)
+            self.end_headers()
+            if not head:
+                body.write(self.wfile, offset)
+
+    return Handler
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def start(port, *options):
+    """
+    在子进程中启动服务器，等端口可以连接后返回进程，基准测试结束时调用terminate()
+    服务器不和被测的下载线程抢GIL
+    """
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), str(port), *options])
+    for _ in range(600):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"stub server on port {port} did not start")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('port', type=int)
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求返回前等待的秒数')
+    parser.add_argument('--size-mb', type=int, help='返回这个大小(MB)的随机内容，而不是k线zip')
+    args = parser.parse_args()
+    Server(('127.0.0.1', args.port), make_handler(Body(args.size_mb), args.latency)).serve_forever()
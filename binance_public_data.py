@@ -8,13 +8,138 @@ from fake_useragent import UserAgent
 import requests
 from datetime import datetime, timedelta
 import os
+import sys
 import time
-from concurrent.futures import ProcessPoolExecutor
-import subprocess
+import threading
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import hashlib
 import zipfile
-import glob
+import shutil
+from xml.etree import ElementTree
+from urllib.parse import urlsplit, parse_qs
+import json
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
+from kline_store import KlineStore
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.compute as pc
+except ImportError:  # 列式存储需要pyarrow，其余功能不依赖
+    pa = None
+    pq = None
+    pc = None
+
+
+class TokenBucket:
+    """
+    令牌桶限速器，替代每次请求后固定的time.sleep(1)
+    rate: 每秒补充的令牌数，capacity: 桶容量，即允许的突发请求数
+    被限流(429/418)时速率减半，请求成功后逐步恢复到初始速率
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        取一个令牌，令牌不足时等待
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+                self.timestamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self, retry_after=None):
+        """
+        被限流，速率减半并清空令牌，有Retry-After时按其暂停
+        """
+        with self.lock:
+            self.rate = max(self.max_rate / 64, self.rate / 2)
+            self.tokens = 0
+        if retry_after:
+            time.sleep(retry_after)
+
+    def recover(self):
+        """
+        请求成功，速率线性恢复
+        """
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 16)
+
+
+class UrlIndex:
+    """
+    url是否存在的持久索引(sqlite)，每个url记录探测结果和探测时间，以及已下载文件的大小和etag
+    只由主进程读写，进程池中的探测结果返回主进程后统一写入
+    """
+
+    def __init__(self, file):
+        self.connection = sqlite3.connect(file)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, found INTEGER, checked_at REAL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS downloads (url TEXT PRIMARY KEY, size INTEGER, etag TEXT)")
+
+    def load(self):
+        """
+        全部记录: {url: (是否存在, 探测时间)}
+        """
+        rows = self.connection.execute("SELECT url, found, checked_at FROM urls")
+        return {url: (bool(found), checked_at) for url, found, checked_at in rows}
+
+    def put(self, results, checked_at):
+        """
+        results: [(url, 是否存在)]
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO urls (url, found, checked_at) VALUES (?, ?, ?)",
+                [(url, int(found), checked_at) for url, found in results])
+
+    def load_downloads(self):
+        """
+        已下载并校验过的zip文件: {url: (大小, etag)}
+        """
+        rows = self.connection.execute("SELECT url, size, etag FROM downloads")
+        return {url: (size, etag) for url, size, etag in rows}
+
+    def put_downloads(self, results):
+        """
+        results: [(url, 大小, etag)]
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO downloads (url, size, etag) VALUES (?, ?, ?)", results)
+
+    def close(self):
+        self.connection.close()
+
+
+# 进程池中每个进程的BinancePublicData实例，进程启动时由_init_worker设置一次，任务只传方法名和参数
+_worker = None
+
+
+def _init_worker(instance):
+    global _worker
+    _worker = instance
+
+
+def _call_worker(method, arg):
+    return getattr(_worker, method)(arg)
 
 
 class BinancePublicData:
@@ -39,9 +164,34 @@ class BinancePublicData:
                 "base": "https://data.binance.vision/data/futures/um/monthly/klines"
             }
     }
+    # 项目自带的交易对列表，用于S3列表不可用时的交易对缓存
+    __symbol_lists = {
+        "spot": ['data/symbols/symbols.txt', 'shell/spot_symbol.txt'],
+        "cm_future": ['data/symbols/cm-futures-symbols.txt', 'shell/cm_symbol.txt'],
+        "um_future": ['data/symbols/um-futures-symbols.txt', 'shell/um_symbol.txt']
+    }
     __start_yyyy_mm = '2017-08'
+    __contract_listing_months = 12  # 交割合约最早在交割前几个月上架，按月份枚举时只在这个范围内查找首月
+    __probe_step = 3  # 探测已下架的交易对时，从后往前每隔几个月发一次HEAD请求
+    __probe_batch_size = 500  # url索引每个任务探测的url数
+    __probe_threads = 16  # 每个进程同时发出的HEAD请求数，仍受每个进程的限速器限制
+    __closed_days = 7  # 月度/日度文件在周期结束后几天内发布，超过这个天数仍不存在的url不再探测
+    __index_ttl = 24 * 60 * 60  # 其余不存在的记录的有效秒数
+    __download_root = 'https://data.binance.vision/'
     __root = os.getcwd()  
     __worker_num = os.cpu_count() 
+    __requests_per_second = 5  # 每个进程每秒最多请求数
+    __max_retries = 5  # 被限流时的最大重试次数
+    __timeout = 30
+    __hash_buffer_size = 8 * 1024 * 1024  # 计算sha256时每次读取的字节数
+    __copy_buffer_size = 1024 * 1024  # 解压时每次复制的字节数
+    __unzip_memory_budget = 8 * 1024 * 1024 * 1024  # 同时解压的文件解压后的总字节数上限
+    __panel_memory_budget = 4 * 1024 * 1024 * 1024  # 同时生成的面板月份占用的总字节数上限
+
+    # 每个进程一个keep-alive会话和限速器，进程池的任务会pickle实例，所以放在类上
+    __session = None
+    __session_pid = None
+    __bucket = None
     __columns = {
         0: 'candle_begin_time_ms',
         1: 'open',
@@ -57,6 +207,52 @@ class BinancePublicData:
         11: 'Ignore'
     }
 
+    # 读取k线csv时每列的类型，float按__float_dtype读取，第11列Ignore不读取
+    __read_dtypes = {
+        0: 'int64',
+        1: 'float',
+        2: 'float',
+        3: 'float',
+        4: 'float',
+        5: 'float',
+        6: 'int64',
+        7: 'float',
+        8: 'int32',
+        9: 'float',
+        10: 'float'
+    }
+
+    __dtypes = {
+        'open': 'float64',
+        'high': 'float64',
+        'low': 'float64',
+        'close': 'float64',
+        'volume': 'float64',
+        'quote/base_asset_volume': 'float64',
+        'num_of_trades': 'int64',
+        'Taker_buy_base_asset_volume': 'float64',
+        'Taker_buy_quote_asset_volume': 'float64'
+    }
+
+    # 每个k线周期的毫秒数, 月线(1mo)按自然月计算
+    __interval_ms = {
+        '1s': 1000,
+        '1m': 60 * 1000,
+        '3m': 3 * 60 * 1000,
+        '5m': 5 * 60 * 1000,
+        '15m': 15 * 60 * 1000,
+        '30m': 30 * 60 * 1000,
+        '1h': 60 * 60 * 1000,
+        '2h': 2 * 60 * 60 * 1000,
+        '4h': 4 * 60 * 60 * 1000,
+        '6h': 6 * 60 * 60 * 1000,
+        '8h': 8 * 60 * 60 * 1000,
+        '12h': 12 * 60 * 60 * 1000,
+        '1d': 24 * 60 * 60 * 1000,
+        '3d': 3 * 24 * 60 * 60 * 1000,
+        '1w': 7 * 24 * 60 * 60 * 1000
+    }
+
     __list = ['candle_begin_time', 'open', 'high', 'low', 'close', 'volume', 'quote/base_asset_volume', 'num_of_trades', 'Taker_buy_base_asset_volume', 'Taker_buy_quote_asset_volume']
 
 
@@ -67,16 +263,59 @@ class BinancePublicData:
         # base: 获取历史数据文件
         self.__intervals = ['1m']
         self.__data = 'data'  # 文件保存路径
+        self.__planner = 'listing'  # listing: 按S3列表只生成存在的url, guess: 按月份枚举url
+        self.__output_format = 'csv'  # 清洗后数据的格式: csv, parquet, arrow, bin(定长二进制，见KlineStore)
+        self.__compression = 'zstd'  # parquet/arrow的压缩方式, None为不压缩
+        self.__incremental = True  # 增量清洗: 只合并manifest中没有记录的新文件
+        self.__float_dtype = 'float64'  # 价格和成交量的类型: float64, float32(内存减半，约7位有效数字)
+        self.__resample_intervals = ['5m', '15m', '1h', '4h', '1d', '1w', '1mo']  # 由清洗后的数据合成的周期，不需要单独下载
+        self.__panel_columns = ['close', 'volume']  # 面板(时间 × symbol矩阵)包含的列
+        self.__symbol_ttl = 24 * 60 * 60  # 交易对缓存(symbols.json)的有效秒数，过期后重新列出S3
+        self.__chunk_size = 1024 * 1024  # 下载时每次读取和写入的字节数，每个进程下载占用的内存与文件大小无关
+        self.__preallocate = hasattr(os, 'posix_fallocate')  # 按Content-Length预先分配磁盘空间，减少碎片，空间不足时立即失败
+        self.__drop_cache = hasattr(os, 'posix_fadvise')  # 写入后用posix_fadvise释放页缓存，避免大文件挤占其他进程的缓存
+        self.__drop_cache_size = 64 * 1024 * 1024  # 每写入多少字节释放一次页缓存
         pass
     
+    def _get_session(self):
+        """
+        获取当前进程的会话，复用连接并缓存user-agent
+        """
+        pid = os.getpid()
+        if BinancePublicData.__session is None or BinancePublicData.__session_pid != pid:
+            session = requests.Session()
+            session.headers['User-Agent'] = UserAgent().random
+            BinancePublicData.__session = session
+            BinancePublicData.__session_pid = pid
+            BinancePublicData.__bucket = TokenBucket(self.__requests_per_second)
+        return BinancePublicData.__session
+
+    def _request(self, url, method='GET', **kwargs):
+        """
+        限速请求，被限流时按Retry-After退避重试
+        """
+        session = self._get_session()
+        for _ in range(self.__max_retries):
+            BinancePublicData.__bucket.acquire()
+            res = session.request(method, url, timeout=self.__timeout, **kwargs)
+            if res.status_code not in (418, 429):
+                BinancePublicData.__bucket.recover()
+                return res
+            retry_after = res.headers.get('Retry-After')
+            BinancePublicData.__bucket.throttle(float(retry_after) if retry_after else None)
+        return res
+
     def _generate_yyyy_mm_list(self):
-        start_date = datetime.strptime(self.__start_yyyy_mm, '%Y-%m')
+        """
+        生成从__start_yyyy_mm到当前月份的yyyy-mm列表，按自然月递增
+        """
+        year, month = map(int, self.__start_yyyy_mm.split('-'))
         end_date = datetime.now()
 
         yyyy_mm_list = []
-        while start_date <= end_date:
-            yyyy_mm_list.append(start_date.strftime('%Y-%m'))
-            start_date += timedelta(days=31)
+        while (year, month) <= (end_date.year, end_date.month):
+            yyyy_mm_list.append(f'{year:04d}-{month:02d}')
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
         return yyyy_mm_list
 
     def _get_type_list(self):
@@ -84,68 +323,363 @@ class BinancePublicData:
         获取历史数据类型列表
         """
         return list(self.__url_config.keys())
-    
-    def _get_html_by_type(self, type: str):
+
+    def _parse_list_bucket(self, xml: str):
         """
-        获取网页html
+        解析S3 ListBucket返回的xml, 与网络无关, 可直接用录制的xml测试
+        返回子目录列表、文件列表(key, size, etag)和翻页标记
         """
-        # 设置爬虫参数
-        ua = UserAgent()
-        ua_random = ua.random
-        headers = {
-            'User-Agent': ua_random
-        }
+        root = ElementTree.fromstring(xml)
+        # 去掉命名空间, 方便按标签名查找
+        for element in root.iter():
+            element.tag = element.tag.split('}')[-1]
 
-        # 获取html
-        try:
-            res = requests.get(url=self.__url_config[type]["symbol"], headers=headers)
+        prefixes = [element.text for element in root.findall('CommonPrefixes/Prefix')]
+        contents = []
+        for element in root.findall('Contents'):
+            contents.append({
+                'key': element.findtext('Key'),
+                'size': int(element.findtext('Size', '0')),
+                'etag': element.findtext('ETag', '').strip('"'),
+            })
+
+        # ListObjects v1 用marker翻页, 没有NextMarker时用最后一个key; v2 用continuation-token
+        truncated = root.findtext('IsTruncated', 'false') == 'true'
+        next_page = None
+        if truncated:
+            token = root.findtext('NextContinuationToken')
+            if token:
+                next_page = {'continuation-token': token}
+            else:
+                marker = root.findtext('NextMarker') or max([c['key'] for c in contents] + prefixes)
+                next_page = {'marker': marker}
+        return prefixes, contents, next_page
+
+    def _list_bucket(self, type: str, prefix: str):
+        """
+        列出S3上某个前缀下的子目录和文件, 自动翻页
+        """
+        endpoint = self.__url_config[type]["symbol"].split('?')[0]
+        params = {'delimiter': '/', 'prefix': prefix}
+        prefixes = []
+        contents = []
+        while True:
+            res = self._request(endpoint, params=params)
             res.raise_for_status()
-            html = res.text
-            return html
-        except requests.HTTPError as e:
-            print(e)
-            print(f"====={res} 访问失败=====")
-            return None
-        except Exception as e:
-            print(e)
-            print(f"====={res} 访问失败=====")
-            return None
+            page_prefixes, page_contents, next_page = self._parse_list_bucket(res.text)
+            prefixes += page_prefixes
+            contents += page_contents
+            if not next_page:
+                return prefixes, contents
+            params = {'delimiter': '/', 'prefix': prefix, **next_page}
+
+    def _get_type_prefix(self, type: str):
+        """
+        获取历史数据类型在S3上的前缀, 例如data/spot/monthly/klines/
+        """
+        query = urlsplit(self.__url_config[type]["symbol"]).query
+        return parse_qs(query)['prefix'][0]
+
+    def _get_contract_month(self, symbol: str):
+        """
+        交割合约(例如BTCUSD_200925)的交割月份，交割之后没有数据，永续合约和现货返回None
+        """
+        match = re.search(r'_(\d{2})(\d{2})\d{2}$', symbol)
+        return f'20{match.group(1)}-{match.group(2)}' if match else None
+
+    def _load_symbol_cache(self):
+        """
+        读取交易对缓存: {类型: {'refreshed_at': 时间戳, 'symbols': {symbol: [首月, 末月]}}}，月份未知时为None
+        """
+        try:
+            with open(os.path.join(self.__root, 'symbols.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_symbol_cache(self, cache):
+        file = os.path.join(self.__root, 'symbols.json')
+        with open(file + '.tmp', 'w') as f:
+            json.dump(cache, f)
+        os.replace(file + '.tmp', file)
+
+    def _seed_symbols(self, type: str):
+        """
+        项目自带的交易对列表，包含已下架的交易对，S3列表不可用时使用
+        """
+        symbols = set()
+        for file in self.__symbol_lists[type]:
+            path = os.path.join(self.__root, file)
+            if os.path.exists(path):
+                with open(path) as f:
+                    symbols.update(line.strip().upper() for line in f if line.strip())
+        return {symbol: [None, self._get_contract_month(symbol)] for symbol in symbols}
 
     def _get_history_symbol(self, type: str):
         """
-        获取历史交易对
+        获取历史交易对，S3列表缓存在symbols.json中，超过__symbol_ttl秒才重新列出
+        已经记录的首月、末月保留，S3不可用时用缓存，没有缓存时用项目自带的列表
         """
-        # 定义正则表达式
-        regex = r'/klines/(\w+)/</Prefix>'
+        cache = self._load_symbol_cache()
+        entry = cache.get(type)
+        if entry is None or time.time() - entry['refreshed_at'] > self.__symbol_ttl:
+            known = entry['symbols'] if entry else {}
+            try:
+                prefixes, _ = self._list_bucket(type, self._get_type_prefix(type))
+            except (requests.RequestException, ElementTree.ParseError) as e:
+                print(f"{type} 交易对列表获取失败，使用缓存: {e}")
+                if entry is None:
+                    # 不记录刷新时间，下次运行重新列出
+                    cache[type] = {'refreshed_at': 0, 'symbols': self._seed_symbols(type)}
+                    self._save_symbol_cache(cache)
+                return sorted(cache[type]['symbols'])
+            names = [prefix.rstrip('/').split('/')[-1] for prefix in prefixes]
+            entry = {
+                'refreshed_at': time.time(),
+                'symbols': {name: known.get(name, [None, self._get_contract_month(name)]) for name in names}
+            }
+            cache[type] = entry
+            self._save_symbol_cache(cache)
+        return sorted(entry['symbols'])
 
-        # 读取html文件
-        html = self._get_html_by_type(type)
-        
-        # 利用正则表达式匹配
-        symbols = re.findall(regex, html)
+    def _update_symbol_bounds(self, type: str, months: dict):
+        """
+        按S3列表中实际存在的文件记录每个symbol的首月和末月
+        末月只记录交割合约和下个月的文件过了发布期限仍不存在的(已下架)，仍在交易的交易对末月不确定
+        months: {symbol: [yyyy-mm, ...]}
+        """
+        cache = self._load_symbol_cache()
+        symbols = cache.setdefault(type, {'refreshed_at': 0, 'symbols': {}})['symbols']
+        for symbol, symbol_months in months.items():
+            if not symbol_months:
+                continue
+            first, last = min(symbol_months), max(symbol_months)
+            contract_month = self._get_contract_month(symbol)
+            symbols[symbol] = [first, contract_month or (last if self._is_closed_after(last) else None)]
+        self._save_symbol_cache(cache)
 
-        return symbols
+    def _is_closed_after(self, yyyy_mm: str):
+        """
+        yyyy_mm的下个月是否已结束__closed_days天: 这时下个月的月度文件应该已经发布，仍不存在说明yyyy_mm就是末月
+        每月前几天上个月的文件还没发布，这时看到的末月不可信，不能写入缓存，否则仍在交易的交易对之后的月份都会被跳过
+        """
+        year, month = map(int, yyyy_mm.split('-'))
+        # 下个月结束的时间，即yyyy_mm之后第二个月的第一天
+        period_end = datetime(year + (month + 1) // 12, (month + 1) % 12 + 1, 1)
+        return time.time() >= period_end.timestamp() + self.__closed_days * 24 * 60 * 60
 
-    def _generate_url(self, type: str):
+    def _plan_url(self, type: str):
+        """
+        按S3列表生成实际存在的文件, 每个文件包含url、大小和etag
+        """
+        plan = []
+        months = {}
+        type_prefix = self._get_type_prefix(type)
+        for symbol in self._get_history_symbol(type):
+            months[symbol] = []
+            for interval in self.__intervals:
+                _, contents = self._list_bucket(type, f'{type_prefix}{symbol}/{interval}/')
+                for content in contents:
+                    plan.append({
+                        'url': self.__download_root + content['key'],
+                        'size': content['size'],
+                        'etag': content['etag'],
+                    })
+                    match = re.search(r'-(\d{4}-\d{2})\.zip$', content['key'])
+                    if match:
+                        months[symbol].append(match.group(1))
+        # 记下每个symbol的首月和末月，按月份枚举时跳过上架之前和下架之后的月份
+        self._update_symbol_bounds(type, months)
+        return plan
+
+    def _get_month_url(self, type: str, symbol: str, interval: str, yyyy_mm: str):
+        """
+        某个symbol某个周期的月度zip文件的url
+        """
+        return "{}/{}/{}/{symbol}-{interval}-{yyyy_mm}.zip".format(self.__url_config[type]["base"], symbol, interval, symbol=symbol, interval=interval, yyyy_mm=yyyy_mm)
+
+    def _exists(self, url):
+        """
+        用HEAD请求判断文件是否存在，不下载内容
+        只有404算不存在，重试后仍被限流、5xx、403等无法判断的状态抛出HTTPError，由调用方当作探测失败
+        """
+        res = self._request(url, method='HEAD')
+        if res.status_code == 200:
+            return True
+        if res.status_code == 404:
+            return False
+        raise requests.HTTPError(f"{res.status_code} {url}", response=res)
+
+    def _get_probe_months(self, symbol: str, yyyy_mm_list: list):
+        """
+        探测首月和末月时的候选月份: 到上个月为止(当月的月度文件还没有发布)
+        交割合约只在交割月之前__contract_listing_months个月内查找
+        """
+        months = yyyy_mm_list[:-1]
+        contract_month = self._get_contract_month(symbol)
+        if contract_month is not None:
+            months = [yyyy_mm for yyyy_mm in months if yyyy_mm <= contract_month][-self.__contract_listing_months:]
+        return months
+
+    def _probe_symbol_bounds(self, task):
+        """
+        用HEAD请求和二分查找确定一个symbol有数据的首月和末月，返回(symbol, [首月, 末月])，找不到时返回None
+        假设首月和末月之间每个月都有数据，只探测第一个周期；仍在交易、或下个月的文件还没到发布期限的交易对末月为None
+        任何一次探测失败(被限流、5xx等非200/404的状态)都放弃这个symbol并返回None，不把错误的范围写入缓存
+        task: (类型, symbol, 候选月份列表)
+        """
+        type, symbol, months = task
+        interval = self.__intervals[0]
+
+        def exists(i):
+            return self._exists(self._get_month_url(type, symbol, interval, months[i]))
+
+        def search_first(lo, hi):
+            # [lo, hi]中第一个存在的月份，hi已知存在
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if exists(mid):
+                    hi = mid
+                else:
+                    lo = mid + 1
+            return lo
+
+        def search_last(lo, hi):
+            # [lo, hi]中最后一个存在的月份，lo已知存在
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if exists(mid):
+                    lo = mid
+                else:
+                    hi = mid - 1
+            return lo
+
+        try:
+            last = len(months) - 1
+            if not exists(last):
+                # 已下架: 从后往前每隔__probe_step个月探测一次，找到一个存在的月份后再二分查找末月
+                anchor = next((i for i in range(last - self.__probe_step, -1, -self.__probe_step) if exists(i)), None)
+                if anchor is None:
+                    return None
+                last = search_last(anchor, min(anchor + self.__probe_step, len(months) - 1))
+            first = search_first(0, last)
+        except requests.RequestException as e:
+            print(f"{symbol} 首月和末月探测失败，下次重新探测: {e}")
+            return None
+        contract_month = self._get_contract_month(symbol)
+        if contract_month is not None:
+            return symbol, [months[first], months[last]]
+        # 下个月的文件可能只是还没发布，过了发布期限才记录末月
+        return symbol, [months[first], months[last] if self._is_closed_after(months[last]) else None]
+
+    def _guess_url(self, type: str):
         """
-        生成url, 用于下载历史数据, 包括生成zip文件的url和checksum文件的url
+        按月份枚举url, S3列表不可用时使用
+        首月未知的symbol先用HEAD请求和二分查找确定首月和末月，只枚举这之间的月份
         """
-        # 记录urls
-        zip_urls = []
-        checksum_urls = []
-        # 生成标签
+        plan = []
         symbols = self._get_history_symbol(type)
-        # 生成yyyy-mm列表
         yyyy_mm_list = self._generate_yyyy_mm_list()
 
+        cache = self._load_symbol_cache()
+        known = cache.setdefault(type, {'refreshed_at': 0, 'symbols': {}})['symbols']
+        tasks = [(type, symbol, self._get_probe_months(symbol, yyyy_mm_list)) for symbol in symbols
+                 if known.get(symbol, [None])[0] is None]
+        tasks = [task for task in tasks if task[2]]
+        if tasks:
+            print(f"{type} 探测{len(tasks)}个symbol的首月和末月")
+            for result in self._map_multiprocess('_probe_symbol_bounds', tasks):
+                if result is not None:
+                    symbol, bounds = result
+                    known[symbol] = bounds
+            self._save_symbol_cache(cache)
+
         for symbol in symbols:
+            # 跳过已知的上架之前和下架之后的月份
+            first, last = known.get(symbol, [None, self._get_contract_month(symbol)])
+            symbol_months = [yyyy_mm for yyyy_mm in yyyy_mm_list
+                             if (first is None or yyyy_mm >= first) and (last is None or yyyy_mm <= last)]
             for interval in self.__intervals:
-                for yyyy_mm in yyyy_mm_list:
-                        url = "{}/{}/{}/{symbol}-{interval}-{yyyy_mm}.zip".format(self.__url_config[type]["base"], symbol, interval, symbol=symbol, interval=interval, yyyy_mm=yyyy_mm)
-                        zip_urls.append(url)
-                        checksum_url = "{}/{}/{}/{symbol}-{interval}-{yyyy_mm}.zip.CHECKSUM".format(self.__url_config[type]["base"], symbol, interval, symbol=symbol, interval=interval, yyyy_mm=yyyy_mm)
-                        checksum_urls.append(checksum_url)        
-        return zip_urls, checksum_urls
+                for yyyy_mm in symbol_months:
+                    url = self._get_month_url(type, symbol, interval, yyyy_mm)
+                    plan.append({'url': url, 'size': None, 'etag': None})
+                    plan.append({'url': url + '.CHECKSUM', 'size': None, 'etag': None})
+        return plan
+
+    def _generate_url(self, type: str):
+        """
+        生成要下载的文件, 包括zip文件和checksum文件, 每个文件包含url、大小和etag(按月份枚举时为None)
+        """
+        if self.__planner == 'listing':
+            plan = self._plan_url(type)
+        else:
+            plan = self._guess_url(type)
+
+        if self.__planner != 'listing':
+            # 枚举的url先查索引，未知的批量HEAD探测，只保留存在的
+            found = set(self._filter_existing([item['url'] for item in plan if item['url'].endswith('.zip')]))
+            plan = [item for item in plan if item['url'].split('.zip')[0] + '.zip' in found]
+        zip_items = [item for item in plan if item['url'].endswith('.zip')]
+        checksum_items = [item for item in plan if item['url'].endswith('.zip.CHECKSUM')]
+        return zip_items, checksum_items
+
+    def _get_url_index(self):
+        return UrlIndex(os.path.join(self.__root, 'url_index.sqlite'))
+
+    def _needs_probe(self, url, entry, now):
+        """
+        url是否需要(重新)探测: 没有记录、或者不存在的记录已过期
+        存在的记录一直有效；文件所在月份结束__closed_days天之后探测到不存在的，以后也不会再有，永不重新探测
+        """
+        if entry is None:
+            return True
+        found, checked_at = entry
+        if found:
+            return False
+        match = re.search(r'-(\d{4})-(\d{2})(?:-(\d{2}))?\.zip$', url)
+        if match:
+            year, month, day = match.groups()
+            if day:
+                period_end = datetime(int(year), int(month), int(day)) + timedelta(days=1)
+            else:
+                period_end = datetime(int(year) + int(month) // 12, int(month) % 12 + 1, 1)
+            if checked_at >= period_end.timestamp() + self.__closed_days * 24 * 60 * 60:
+                return False
+        return now - checked_at > self.__index_ttl
+
+    def _probe_batch(self, urls):
+        """
+        在一个进程中用线程并发HEAD探测一批url，返回[(url, 是否存在)]，请求失败或状态无法判断的为None，不写入索引
+        """
+        def probe(url):
+            try:
+                return url, self._exists(url)
+            except requests.RequestException:
+                return url, None
+
+        with ThreadPoolExecutor(max_workers=self.__probe_threads) as executor:
+            return list(executor.map(probe, urls))
+
+    def _filter_existing(self, urls):
+        """
+        按url索引过滤出存在的url，索引中没有或已过期的分批并发探测后写入索引
+        探测失败的url保留，交给下载时处理
+        """
+        index = self._get_url_index()
+        try:
+            known = index.load()
+            now = time.time()
+            unknown = [url for url in urls if self._needs_probe(url, known.get(url), now)]
+            print(f"{len(urls)}个url，索引中已知{len(urls) - len(unknown)}个，需要探测{len(unknown)}个")
+            if unknown:
+                size = self.__probe_batch_size
+                batches = [unknown[i:i + size] for i in range(0, len(unknown), size)]
+                results = [result for batch in self._map_multiprocess('_probe_batch', batches) for result in batch]
+                index.put([(url, found) for url, found in results if found is not None], now)
+                known.update({url: (found, now) for url, found in results})
+        finally:
+            index.close()
+        return [url for url in urls if known[url][0] is not False]
     
     def _extract_by_regex(self, string: str, regex: str):
         """
@@ -169,9 +703,9 @@ class BinancePublicData:
         """
         urls = []
         for type in self._get_type_list():
-            zip_urls, checksum_ruls = self._generate_url(type)
-            urls += zip_urls
-            urls += checksum_ruls
+            zip_items, checksum_items = self._generate_url(type)
+            urls += [item['url'] for item in zip_items]
+            urls += [item['url'] for item in checksum_items]
         if to_file:
             with open('url.txt', 'w') as f:
                 for url in urls:
@@ -180,127 +714,232 @@ class BinancePublicData:
             print("url.txt文件已生成，供参考和检查")
         return urls
 
-    def _download(self, url):
+    def _get_zip_path(self, url):
         """
-        下载文件
+        zip文件的保存路径: data/<品种>/<symbol>/zip/<文件名>，无法从url中解析symbol和品种时返回None
         """
-        # 设置爬虫参数
-        ua = UserAgent()
-        ua_random = ua.random
-        headers = {
-            'User-Agent': ua_random
-        }
+        # 获取symbol，周期可以是1s、1m、1h、1d等任意周期
+        symbole_regex = r'/(\w+)-\w+-\d{4}-\d{2}\.zip'
+        symbol = self._extract_by_regex(url, symbole_regex)
+
+        # 获取品种
+        market_type_regex = r"/(futures/cm|spot|futures/um)/"
+        market_type = self._extract_by_regex(url, market_type_regex)
+        if symbol is None or market_type is None:
+            return None
+        return os.path.join(self.__data, market_type, symbol, 'zip', url.split("/")[-1])
+
+    def _is_downloaded(self, item, record):
+        """
+        本地是否已有这个文件且与S3上的一致，不需要重新下载
+        .CHECKSUM只在校验通过后写入，有它才算下载完成；S3列表给出的大小不同，或etag与下载时记录的不同(重新发布过)时重新下载
+        item: {'url', 'size', 'etag'}，按月份枚举时大小和etag为None
+        record: 下载时记录的(大小, etag)，没有记录时为None
+        """
+        path = self._get_zip_path(item['url'])
+        if path is None or not os.path.exists(path) or not os.path.exists(path + '.CHECKSUM'):
+            return False
+        if item['size'] is not None and os.path.getsize(path) != item['size']:
+            return False
+        if item['etag'] and record is not None and record[1] and record[1] != item['etag']:
+            return False
+        return True
 
+    def _download(self, url):
+        """
+        下载zip文件和对应的.CHECKSUM文件
+        先下载.CHECKSUM，下载zip时边写入边计算sha256，不一致时重新下载，不需要再读一遍文件校验
+        下载成功时返回(url, 大小, etag)，由主进程记入索引，否则返回None
+        """
         # 下载文件
         try:
-            res = requests.get(url, headers=headers)
+            new_path = self._get_zip_path(url)
+            if new_path is None:
+                print(f'{url} 无法从url中解析symbol和品种，跳过')
+                return
+
+            # 先获取checksum，文件不存在时直接返回
+            res = self._request(url + '.CHECKSUM')
             res.raise_for_status()
-            
-            # 获取symbol
-            symbole_regex = r'/(\w+)-\d+m-\d{4}-\d{2}\.zip'
-            symbol = self._extract_by_regex(url, symbole_regex)
+            checksum = res.text
+            expected = checksum.split()[0].lower()
 
-            # 获取品种
-            market_type_regex = r"/(futures/cm|spot|futures/um)/"
-            market_type = self._extract_by_regex(url, market_type_regex)
+            # 判断文件夹是否存在，不存在则创建
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
 
-            # 获取路径
-            path = os.path.join(self.__data, market_type, symbol, 'zip')
+            # 先写入.part文件，校验通过后再改名
+            part_path = new_path + '.part'
+            error = None
+            for _ in range(self.__max_retries):
+                try:
+                    with self._request(url, stream=True) as res:
+                        res.raise_for_status()
+                        etag = res.headers.get('ETag', '').strip('"') or None
+                        sha256 = self._write_stream(res, part_path)
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                    error = e
+                    continue
+                except requests.RequestException:
+                    raise
+                except OSError as e:
+                    # 预分配或写入失败(例如磁盘空间不足)，重试也不会成功，删掉.part文件
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    print(f'{url} 写入失败: {e}')
+                    return
+                if sha256.hexdigest() == expected:
+                    os.replace(part_path, new_path)
+                    with open(new_path + '.CHECKSUM', 'w') as f:
+                        f.write(checksum)
+                    return url, os.path.getsize(new_path), etag
+                error = f'sha256为{sha256.hexdigest()}，.CHECKSUM为{expected}'
 
-            # 判断文件夹是否存在，不存在则创建
-            if not os.path.exists(path):
-                os.makedirs(path)
-            
-            # 保存文件
-            new_path = os.path.join(path, url.split("/")[-1])  # 这里要看下保存文件的路径是什么
-            with open(new_path, 'wb') as f:
-                f.write(res.content)
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            print(f'{url} 重试{self.__max_retries}次后仍下载失败: {error}')
 
         except requests.HTTPError as e:
-            # print(e)
-            # print(f'{url} 文件不存在')
-            pass
+            print(f'{url} 文件不存在或无法下载: {e}')
         except Exception as e:
-            # print(e)
-            # print(f'{url}  =====下载失败！=====')
-            pass
-        finally:
-            time.sleep(1)
+            print(f'{url} =====下载失败！===== {e}')
 
-    def download_multiprocess(self):
+    def _write_stream(self, res, file):
+        """
+        按__chunk_size流式写入响应并计算sha256，内存占用只有一个块，与文件大小无关
+        有Content-Length时预先分配空间；每写入__drop_cache_size字节，释放已写入部分的页缓存
         """
-        多进程下载
+        sha256 = hashlib.sha256()
+        length = res.headers.get('Content-Length')
+        with open(file, 'wb') as f:
+            fd = f.fileno()
+            if self.__preallocate and length and length.isdigit() and int(length):
+                os.posix_fallocate(fd, 0, int(length))
+            written = dropped = previous = 0
+            for chunk in res.iter_content(chunk_size=self.__chunk_size):
+                sha256.update(chunk)
+                f.write(chunk)
+                written += len(chunk)
+                if self.__drop_cache and written - dropped >= self.__drop_cache_size:
+                    # DONTNEED只释放已写回磁盘的页，并开始回写其余的脏页:
+                    # 上一段此时已经写回，在这次释放；这一段开始回写，在下次释放
+                    f.flush()
+                    os.posix_fadvise(fd, previous, written - previous, os.POSIX_FADV_DONTNEED)
+                    previous, dropped = dropped, written
+            # 连接提前断开时截掉预分配的部分，文件大小与实际写入一致
+            f.truncate(written)
+        return sha256
+
+    def _get_pool(self, workers=None):
+        """
+        进程池，实例只在每个进程启动时pickle一次，之后的任务只传方法名和参数
+        workers: 进程数，默认__worker_num
+        """
+        return ProcessPoolExecutor(max_workers=workers or self.__worker_num, initializer=_init_worker, initargs=(self,))
+
+    def _map_multiprocess(self, method, items, release=None, workers=None):
+        """
+        多进程对每个item调用method并显示进度条，按顺序返回每个任务的结果，由主进程统一处理
+        某个任务出错时仍等所有任务结束，对已完成任务的结果调用release(例如释放共享内存)，再抛出第一个错误
+        workers: 进程数，默认__worker_num，每个任务占用内存很大时用来限制进程数
         """
-        urls = self._generate_urls()
-        with ProcessPoolExecutor(max_workers=self.__worker_num) as pool:
+        results = []
+        error = None
+        with self._get_pool(workers) as pool:
+            # 提交任务
+            futures = [pool.submit(_call_worker, method, item) for item in items]
             # 显示进度条
-            with tqdm(total=len(urls)) as pbar:
-                # 提交任务
-                for _ in pool.map(self._download, urls):
+            with tqdm(total=len(items)) as pbar:
+                for future in futures:
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        error = error or e
+                        results.append(None)
                     # 更新进度条
                     pbar.update()
+        if error is not None:
+            if release is not None:
+                for result in results:
+                    if result is not None:
+                        release(result)
+            raise error
+        return results
 
-        pool.shutdown(True)
-    
-    def _checksum(self, url):
+    def download_multiprocess(self):
         """
-        验证文件完整性
+        多进程下载，.CHECKSUM文件随zip文件一起下载
+        本地已有且大小、etag与S3一致的文件不再下载，下载的大小和etag记入索引，下次运行用来比较
         """
-        # 回到根目录
-        os.chdir(self.__root)
-
-        # 获取symbol
-        symbole_regex = r'/(\w+)-\d+m-\d{4}-\d{2}\.zip'
-        symbol = self._extract_by_regex(url, symbole_regex)
-
-        # 获取品种
-        market_type_regex = r"/(futures/cm|spot|futures/um)/"
-        market_type = self._extract_by_regex(url, market_type_regex)
-
-        # 设置工作路径
-        working_dir = os.path.join(self.__data, market_type, symbol)
-        
-        # 切换工作路径
-        os.chdir(working_dir)
+        items = []
+        for type in self._get_type_list():
+            zip_items, _ = self._generate_url(type)
+            items += zip_items
+        index = self._get_url_index()
+        try:
+            downloaded = index.load_downloads()
+            urls = [item['url'] for item in items if not self._is_downloaded(item, downloaded.get(item['url']))]
+            print(f"{len(items)}个文件，{len(items) - len(urls)}个已下载，{len(urls)}个需要下载")
+            results = self._map_multiprocess('_download', urls)
+            index.put_downloads([result for result in results if result is not None])
+        finally:
+            index.close()
 
-        # 获取路径下的checksum_files
-        checksum_files = glob.glob('*.zip.CHECKSUM')
+    def _sha256(self, file):
+        """
+        计算文件的sha256，用固定大小的缓冲区读取，hashlib计算时会释放GIL
+        """
+        sha256 = hashlib.sha256()
+        buffer = bytearray(self.__hash_buffer_size)
+        view = memoryview(buffer)
+        with open(file, 'rb', buffering=0) as f:
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                sha256.update(view[:size])
+        return sha256.hexdigest()
 
-        # 验证文件完整性
-        for checksum_file in checksum_files:
-            # Run sha256sum command and capture output
-            output = subprocess.run(['sha256sum', '-c', checksum_file], capture_output=True, text=True)
+    def _checksum(self, checksum_file):
+        """
+        验证一个.CHECKSUM文件对应的zip文件，通过时返回None，否则返回失败原因
+        """
+        try:
+            with open(checksum_file) as f:
+                expected, filename = f.read().split()
+        except ValueError:
+            return "CHECKSUM文件格式错误"
 
-            # Check if the output contains the string "OK"
-            if 'OK' in output.stdout:
-                # print(f"{filename} checksum verified successfully")
-                pass
-            else:
-                # 保存到csv文件
-                df = pd.DataFrame({"filename": [checksum_file], "output": [output]})
-                file = os.path.join(self.__root, 'checksum.csv')
-                df.to_csv(file, mode='a', header=False, index=False)
+        zip_file = os.path.join(os.path.dirname(checksum_file), filename)
+        if not os.path.exists(zip_file):
+            return "zip文件不存在"
+        if self._sha256(zip_file) != expected.lower():
+            return "FAILED"
+        return None
  
     def checksum_multiprocess(self):
         """
-        多进程验证文件完整性
+        多线程验证文件完整性，每个.CHECKSUM文件只验证一次，结果最后统一写入checksum.csv
         """
-        urls = self._generate_urls()
-        with ProcessPoolExecutor(max_workers=self.__worker_num) as pool:
+        checksum_files = self._get_file_relative_path(self.__data, ".CHECKSUM")
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.__worker_num) as pool:
             # 显示进度条
-            with tqdm(total=len(urls)) as pbar:
+            with tqdm(total=len(checksum_files)) as pbar:
                 # 提交任务
-                for _ in pool.map(self._checksum, urls):
+                for checksum_file, output in zip(checksum_files, pool.map(self._checksum, checksum_files)):
+                    if output is not None:
+                        failures.append({"filename": checksum_file, "output": output})
                     # 更新进度条
                     pbar.update()
 
         # 保存到csv文件
         file = os.path.join(self.__root, 'checksum.csv')
-        try:
-            df = pd.read_csv(file, header=None, names=['filename', 'output'])
-            df.to_csv(file, index=False)
+        if failures:
+            pd.DataFrame(failures).to_csv(file, index=False)
             print("checksum已检查完毕，请查看checksum.csv文件")
-        except FileNotFoundError:
+        else:
+            if os.path.exists(file):
+                os.remove(file)
             print("checksum已检查完毕，数据完整")
 
     def _get_file_relative_path(self, path, file_type: str):
@@ -315,95 +954,133 @@ class BinancePublicData:
                     relative_path.append(os.path.relpath(file_path, self.__root))
         return relative_path
 
+    def _get_unzip_size(self, zip_file):
+        """
+        zip文件解压后的字节数，只读取中央目录
+        """
+        try:
+            with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+                return sum(info.file_size for info in zip_ref.infolist() if not info.is_dir())
+        except zipfile.BadZipFile:
+            return 0
+
     def _unzip(self, zip_file):
         """
-        解压zip文件
+        用固定大小的缓冲区流式解压zip文件，先写入.part文件，完整后再重命名
+        返回(进程号, 解压字节数, 耗时)，用于统计每个进程的解压速度
         """
         # 设置储存路径
         dir_path = os.path.dirname(zip_file)
         csv_path = dir_path.replace("zip", "csv")
-        # print(new_file_path)
+        os.makedirs(csv_path, exist_ok=True)
 
+        start = time.perf_counter()
+        size = 0
         try:
             with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-                csv_file = zip_ref.namelist()[0]
-                zip_ref.extract(csv_file, path=csv_path)
-                # print(f"{csv_file} extracted successfully")
-        except FileExistsError:
-            pass
+                for info in zip_ref.infolist():
+                    if info.is_dir():
+                        continue
+                    csv_file = os.path.join(csv_path, os.path.basename(info.filename))
+                    # 已经完整解压过的文件跳过
+                    if os.path.exists(csv_file) and os.path.getsize(csv_file) == info.file_size:
+                        continue
+                    with zip_ref.open(info) as src, open(csv_file + '.part', 'wb') as dst:
+                        shutil.copyfileobj(src, dst, self.__copy_buffer_size)
+                    os.replace(csv_file + '.part', csv_file)
+                    size += info.file_size
+        except (zipfile.BadZipFile, OSError) as e:
+            print(f"{zip_file} =====解压失败！===== {e}")
+        return os.getpid(), size, time.perf_counter() - start
 
     def unzip_multiprocess(self):
         """
         多进程解压zip文件
+        大文件优先调度，同时解压的文件解压后总大小不超过__unzip_memory_budget，
+        超过预算的单个文件单独解压，避免大的trades文件和小的1d文件混在一起时内存和磁盘压力失控
         """
         zip_files = self._get_file_relative_path(self.__data, ".zip")
-        with ProcessPoolExecutor(max_workers=self.__worker_num) as pool:
+        sizes = {zip_file: self._get_unzip_size(zip_file) for zip_file in zip_files}
+        pending = sorted(zip_files, key=sizes.get)  # 从列表尾部取出，先解压最大的文件
+
+        running = {}
+        in_flight = 0
+        stats = {}  # 进程号: [解压字节数, 耗时]
+        with self._get_pool() as pool:
             # 显示进度条
             with tqdm(total=len(zip_files)) as pbar:
-                # 提交任务
-                for _ in pool.map(self._unzip, zip_files):
-                    # 更新进度条
-                    pbar.update()
-        pool.shutdown(True)
+                while pending or running:
+                    # 预算允许时提交任务，没有任务在运行时至少提交一个
+                    while pending and len(running) < self.__worker_num and \
+                            (not running or in_flight + sizes[pending[-1]] <= self.__unzip_memory_budget):
+                        zip_file = pending.pop()
+                        running[pool.submit(_call_worker, '_unzip', zip_file)] = zip_file
+                        in_flight += sizes[zip_file]
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        in_flight -= sizes[running.pop(future)]
+                        pid, size, seconds = future.result()
+                        stat = stats.setdefault(pid, [0, 0.0])
+                        stat[0] += size
+                        stat[1] += seconds
+                        # 更新进度条
+                        pbar.update()
+
+        for pid, (size, seconds) in sorted(stats.items()):
+            print(f"进程{pid}: 解压{size / 1024 / 1024:.1f}MB, {size / 1024 / 1024 / seconds if seconds else 0:.1f}MB/s")
 
-    def _drop_dirty_data(self, df):
+    def _get_dtypes(self):
         """
-        检查有没有脏数据在里面
+        清洗后数据每列的类型，价格和成交量用__float_dtype
         """
-        # Check if the first value in the first column is a timestamp
-        try:
-            pd.to_datetime(df.iloc[0, 0])
-        except ValueError:
-            # If it's not a timestamp, delete the first row of the data
-            df = df.drop(df.index[0])
-        return df
+        return {column: self.__float_dtype if dtype == 'float64' else dtype for column, dtype in self.__dtypes.items()}
+
+    def _read_klines(self, csv_file):
+        """
+        按固定的类型读取k线csv，不读取Ignore列
+        有的文件第一行是表头，只看第一个字节是不是数字来判断，不需要逐个单元格解析
+        csv_file为二进制文件对象(解压后的文件或zip中的文件)
+        """
+        header = not csv_file.peek(1)[:1].isdigit()
+        dtype = {column: self.__float_dtype if dtype == 'float' else dtype for column, dtype in self.__read_dtypes.items()}
+        return pd.read_csv(csv_file, header=None, skiprows=1 if header else None,
+                           names=list(self.__read_dtypes), usecols=list(self.__read_dtypes), dtype=dtype)
+
+    def _read_csv(self, csv_file):
+        """
+        读取解压后的k线csv文件
+        """
+        with open(csv_file, 'rb') as f:
+            return self._read_klines(f)
 
     def _clean_data(self, symbol_path):
         """
         清洗数据
         """
+        symbol = os.path.basename(symbol_path)
         try:
             # 获取所有csv文件
             csv_path = os.path.join(symbol_path, 'csv')
             csvs = self._get_file_relative_path(csv_path, ".csv")
-            # 读取csv文件
-            result = pd.DataFrame()
-            for csv in csvs:
-                df = pd.read_csv(csv, header=None, names=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11])
-                df = self._drop_dirty_data(df)
-                result = result.append(df)
-            
-            # 整理数据
-            result.rename(columns=self.__columns, inplace=True)  # 重命名
-            result['candle_begin_time'] = pd.to_datetime(result['candle_begin_time_ms'], unit='ms')  # 整理时间
-            result = result[self.__list].copy()  # 整理列的顺序
-            
-            # 去重、排序
-            result.drop_duplicates(subset=['candle_begin_time'], keep='last', inplace=True)
-            result.sort_values('candle_begin_time', inplace=True)
-            result.reset_index(drop=True, inplace=True)
-
-            # 保存数据
-            symbol = os.path.basename(symbol_path)
-            file = os.path.join(symbol_path, f'{symbol}.csv')
-            result.to_csv(file, index=False)
+            # 按月份合并、去重、排序并保存
+            self._merge(symbol_path, csvs, self._read_csv)
         except KeyError:
             print(f"{symbol} =====清洗失败！=====")
             pass
 
-    def _get_all_symbol_path(self):
+    def _get_all_symbol_path(self, file_type=".csv"):
         """
         获取所有symbol路径
         """
-        # 根据csv文件获取路径
-        zip_files = self._get_file_relative_path(self.__data, ".csv")
+        # 根据csv(或zip)文件获取路径
+        zip_files = self._get_file_relative_path(self.__data, file_type)
         pre_symbols = [os.path.dirname(os.path.dirname(zip_file)) for zip_file in zip_files]
         
         # 去除掉重复的路径
         symbols = list(set(pre_symbols))
 
         # 去除掉不需要的路径
-        bad_symbols = [r"data\futures\cm", r"data\futures\um", r"data\spot"]
+        bad_symbols = [os.path.join(self.__data, "futures", "cm"), os.path.join(self.__data, "futures", "um"), os.path.join(self.__data, "spot")]
         symbols = [symbol for symbol in symbols if symbol not in bad_symbols]
 
         return symbols
@@ -414,79 +1091,685 @@ class BinancePublicData:
         """
         # 获取所有zip文件夹的路径
         symbols = self._get_all_symbol_path()
+        self._map_multiprocess('_clean_data', symbols)
 
-        with ProcessPoolExecutor(max_workers=self.__worker_num) as pool:
-            # 显示进度条
-            with tqdm(total=len(symbols)) as pbar:
-                # 提交任务
-                for _ in pool.map(self._clean_data, symbols):
-                    # 更新进度条
-                    pbar.update()
+    def _format_klines(self, df):
+        """
+        整理k线数据: 重命名、整理时间、整理列的顺序、统一数据类型
+        """
+        df = df.rename(columns=self.__columns)
+        time_ms = df['candle_begin_time_ms'].astype('int64')
+        # 2025年起现货数据的时间戳是微秒
+        time_ms = time_ms.where(time_ms < 10 ** 14, time_ms // 1000)
+        df['candle_begin_time'] = pd.to_datetime(time_ms, unit='ms')
+        return df[self.__list].astype(self._get_dtypes())
+
+    def _read_zip(self, zip_file):
+        """
+        直接从zip文件中流式读取k线，不解压到磁盘
+        """
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            with zip_ref.open(zip_ref.namelist()[0]) as csv_file:
+                return self._read_klines(csv_file)
 
-        pool.shutdown(True)
+    def _iter_sources(self, sources, read, last_time=None):
+        """
+        按月份顺序逐个读取源文件(csv或zip)，整理、去重后逐个返回(源文件, DataFrame)
+        读取失败的源文件返回(源文件, None)，由调用方记入manifest，避免每次都当作新文件
+        """
+        for source in sorted(sources, key=os.path.basename):
+            try:
+                df = self._format_klines(read(source))
+            except (zipfile.BadZipFile, KeyError, ValueError):
+                print(f"{source} =====读取失败！=====")
+                yield source, None
+                continue
+
+            # 去重、排序，文件按月份顺序读取，只需要去掉不晚于上个文件最后时间的数据
+            df = df.drop_duplicates(subset=['candle_begin_time'], keep='last')
+            df = df.sort_values('candle_begin_time')
+            if last_time is not None:
+                df = df[df['candle_begin_time'] > last_time]
+            if not df.empty:
+                last_time = df['candle_begin_time'].iloc[-1]
+            yield source, df
 
-    def _check_data_integrity(self, symbol_path):
+    def _get_source_stat(self, source):
         """
-        检查数据完整性
+        源文件的大小和修改时间，用来判断已合并的文件有没有变化
         """
-        # 获取csv文件
-        regex = r'\\(\w+)$'
-        symbol = self._extract_by_regex(symbol_path, regex)
-        csv_file = os.path.join(symbol_path, f'{symbol}.csv')
-        df = pd.read_csv(csv_file)
+        stat = os.stat(source)
+        return [stat.st_size, stat.st_mtime_ns]
 
-        # 检查数据完整性
-        start = min(df['candle_begin_time'])
-        end = max(df['candle_begin_time'])
-        expected = pd.date_range(start=start, end=end, freq='1min').strftime('%Y-%m-%d %H:%M')
-        actual = pd.to_datetime(df['candle_begin_time']).dt.strftime('%Y-%m-%d %H:%M')
+    def _load_manifest(self, symbol_path, file):
+        """
+        读取manifest，数据文件不存在、格式不同或被改动过时返回None
+        """
+        manifest_file = os.path.join(symbol_path, 'manifest.json')
+        try:
+            with open(manifest_file) as f:
+                manifest = json.load(f)
+            if manifest['format'] != self.__output_format or manifest.get('float_dtype', 'float64') != self.__float_dtype \
+                    or manifest['size'] != self._get_data_size(file):
+                return None
+            if self.__output_format in ('parquet', 'arrow') and not os.path.isdir(file):
+                # 旧版本的单个parquet/arrow文件不能按月追加，重新合并成目录
+                return None
+            return manifest
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
 
-        missing = expected[~expected.isin(actual)]
+    def _save_manifest(self, symbol_path, file, sources, last_time):
+        """
+        保存manifest: 已合并的源文件、每个源文件的数据范围，以及数据文件的大小和最后时间
+        """
+        manifest = {
+            'format': self.__output_format,
+            'float_dtype': self.__float_dtype,
+            'size': self._get_data_size(file),
+            'last_time': last_time,
+            'sources': sources,
+        }
+        manifest_file = os.path.join(symbol_path, 'manifest.json')
+        with open(manifest_file + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_file + '.tmp', manifest_file)
+
+    def _merge(self, symbol_path, sources, read):
+        """
+        把一个symbol按月份的源文件合并到清洗后的数据，内存中只保留一个月的数据
+        manifest记录已合并的源文件及其数据范围，增量模式下只读取新增的源文件并追加到已有数据后面
+        已合并的源文件有变化，或新数据不全在已有数据之后时，重新合并全部源文件
+        """
+        file = self._get_data_file(symbol_path)
+        manifest = self._load_manifest(symbol_path, file) if self.__incremental else None
+
+        if manifest is not None:
+            merged = manifest['sources']
+            changed = [source for source in sources
+                       if os.path.basename(source) in merged
+                       and merged[os.path.basename(source)]['stat'] != self._get_source_stat(source)]
+            new_sources = [source for source in sources if os.path.basename(source) not in merged]
+            if not changed and not new_sources:
+                return
+            if not changed:
+                # 新增的一般只有最近一个月，可以一次读入
+                new = list(self._iter_sources(new_sources, read))
+                frames = [df for _, df in new if df is not None and not df.empty]
+                # 新文件都读取失败或没有数据时，只记入manifest，不需要重新合并
+                if not frames or frames[0]['candle_begin_time'].iloc[0] > pd.Timestamp(manifest['last_time'], unit='ms'):
+                    last_time = manifest['last_time']
+                    for source, df in new:
+                        entry = self._get_source_entry(source, df)
+                        merged[os.path.basename(source)] = entry
+                        if entry['end'] is not None:
+                            last_time = entry['end']
+                    if frames:
+                        self._write_data(frames, file, append=True)
+                    self._save_manifest(symbol_path, file, merged, last_time)
+                    return
+
+        # 重新合并全部源文件
+        merged = {}
+        last_time = None
+
+        def frames():
+            nonlocal last_time
+            for source, df in self._iter_sources(sources, read):
+                entry = self._get_source_entry(source, df)
+                merged[os.path.basename(source)] = entry
+                if entry['end'] is not None:
+                    last_time = entry['end']
+                    yield df
+
+        self._write_data(frames(), file)
+        if merged and os.path.exists(file):
+            self._save_manifest(symbol_path, file, merged, last_time)
+
+    def _get_source_entry(self, source, df):
+        """
+        manifest中一个源文件的记录: 文件状态、行数和数据的起止时间(毫秒)
+        读取失败(df为None)的文件行数为None，重新下载后文件状态变化，会按已合并文件有变化处理
+        """
+        if df is None:
+            return {'stat': self._get_source_stat(source), 'rows': None, 'start': None, 'end': None}
+        times = df['candle_begin_time'].values.astype('datetime64[ms]').astype('int64')
+        return {
+            'stat': self._get_source_stat(source),
+            'rows': len(df),
+            'start': int(times[0]) if len(times) else None,
+            'end': int(times[-1]) if len(times) else None,
+        }
+
+    def _ingest(self, symbol_path):
+        """
+        把一个symbol的zip文件按月份顺序直接写入存储，不经过解压和csv
+        """
+        zip_path = os.path.join(symbol_path, 'zip')
+        zip_files = self._get_file_relative_path(zip_path, ".zip")
+        self._merge(symbol_path, zip_files, self._read_zip)
+
+    def ingest_multiprocess(self):
+        """
+        多进程把zip文件直接写入__output_format格式的存储，替代解压+清洗两个步骤
+        默认格式是csv，需要列式存储时把__output_format设为parquet、arrow或bin
+        """
+        symbol_paths = self._get_all_symbol_path(".zip")
+        self._map_multiprocess('_ingest', symbol_paths)
+
+    def _get_schema(self):
+        """
+        清洗后数据的arrow类型: 毫秒时间戳、float64价格和成交量、int64成交笔数
+        """
+        fields = [pa.field('candle_begin_time', pa.timestamp('ms'))]
+        for column, dtype in self._get_dtypes().items():
+            fields.append(pa.field(column, pa.from_numpy_dtype(np.dtype(dtype))))
+        return pa.schema(fields)
+
+    def _get_data_file(self, symbol_path, interval=None):
+        """
+        获取清洗后数据的文件路径，interval为合成的周期时文件名加上周期
+        """
+        symbol = os.path.basename(symbol_path)
+        if interval is not None:
+            return os.path.join(symbol_path, f'{symbol}_{interval}.{self.__output_format}')
+        return os.path.join(symbol_path, f'{symbol}.{self.__output_format}')
+
+    def get_kline_store(self, symbol_path):
+        """
+        打开bin格式的清洗后数据，store[start:end]按时间切片
+        """
+        return KlineStore(self._get_data_file(symbol_path))
+
+    def _get_parts(self, file):
+        """
+        parquet/arrow的清洗后数据是一个目录，每个月(每个源文件)一个文件，按第一根k线的时间命名，按文件名排序即按时间排序
+        旧版本的单个文件也按只有一个部分处理
+        """
+        if not os.path.isdir(file):
+            return [file]
+        extension = os.path.splitext(file)[1]
+        return [os.path.join(file, name) for name in sorted(os.listdir(file)) if name.endswith(extension)]
+
+    def _get_data_size(self, file):
+        """
+        清洗后数据的大小，目录为所有部分的大小之和，用来判断数据有没有被改动过
+        """
+        return sum(os.path.getsize(part) for part in self._get_parts(file))
+
+    def _write_part(self, table, file):
+        """
+        把一个月的数据写成一个parquet或arrow文件，先写临时文件再改名
+        """
+        tmp_file = file + '.tmp'
+        if self.__output_format == 'parquet':
+            pq.write_table(table, tmp_file, row_group_size=max(1, table.num_rows), compression=self.__compression or 'none')
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=self.__compression)
+            with pa.ipc.new_file(tmp_file, table.schema, options=options) as writer:
+                writer.write_table(table, max_chunksize=max(1, table.num_rows))
+        os.replace(tmp_file, file)
+
+    def _remove_data(self, file):
+        """
+        删除清洗后的数据，目录或旧版本的单个文件
+        """
+        if os.path.isdir(file):
+            shutil.rmtree(file)
+        elif os.path.exists(file):
+            os.remove(file)
+
+    def _write_data(self, frames, file, append=False, interval=None):
+        """
+        按月写入清洗后的数据，frames为按时间顺序、每个月一个的DataFrame
+        parquet/arrow写成目录，每个月一个文件，读取时可以按月裁剪
+        先写临时文件(目录)再替换，中断时不会留下半个文件
+        append: 追加到已有数据后面，只写入新的数据，不读取也不复制已有数据
+        interval: 数据的周期，默认为下载的周期
+        """
+        tmp_file = file + '.tmp'
+        written = False
+
+        if self.__output_format == 'bin':
+            # 定长记录，追加时直接写在文件末尾
+            interval = self.__interval_ms[interval or self.__intervals[0]]
+            rows = KlineStore.write(file if append else tmp_file, frames, interval, list(self.__dtypes), append=append)
+            if append:
+                return
+            written = rows > 0
+            if not written:
+                os.remove(tmp_file)
+        elif self.__output_format == 'csv':
+            if append:
+                for df in frames:
+                    df.to_csv(file, mode='a', header=False, index=False)
+                return
+            for df in frames:
+                df.to_csv(tmp_file, mode='a' if written else 'w', header=not written, index=False)
+                written = True
+        else:
+            if pa is None:
+                raise ImportError("parquet/arrow格式需要安装pyarrow: pip install pyarrow")
+
+            # 追加时新的月份直接写进已有目录，否则写进临时目录
+            path = file if append else tmp_file
+            if not append:
+                self._remove_data(tmp_file)
+            os.makedirs(path, exist_ok=True)
+            schema = self._get_schema()
+            extension = os.path.splitext(file)[1]
+            for df in frames:
+                table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+                name = pd.Timestamp(df['candle_begin_time'].iloc[0]).strftime('%Y%m%d%H%M') + extension
+                self._write_part(table, os.path.join(path, name))
+                written = True
+            if append:
+                return
+            if not written:
+                self._remove_data(tmp_file)
+
+        if written:
+            if os.path.isdir(tmp_file):
+                # 目录不能直接替换: 先把旧数据改名，换上新目录后再删除
+                old_file = file + '.old'
+                self._remove_data(old_file)
+                if os.path.exists(file):
+                    os.replace(file, old_file)
+                os.replace(tmp_file, file)
+                self._remove_data(old_file)
+            else:
+                os.replace(tmp_file, file)
+
+    def _read_table(self, file, columns=None):
+        """
+        读取一个parquet或arrow文件
+        """
+        if file.endswith('.parquet'):
+            return pq.read_table(file, columns=columns)
+        with pa.memory_map(file) as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.select(columns) if columns else table
+
+    def _read_data(self, file, columns=None):
+        """
+        读取清洗后的数据
+        """
+        if file.endswith('.bin'):
+            # 二进制存储所有列都是float64，缺失的k线不返回
+            df = KlineStore(file).to_frame().astype(self._get_dtypes())
+            return df[columns] if columns else df
+        if file.endswith(('.parquet', '.arrow')):
+            tables = [self._read_table(part, columns) for part in self._get_parts(file)]
+            if not tables:
+                schema = self._get_schema()
+                tables = [schema.empty_table().select(columns) if columns else schema.empty_table()]
+            return pa.concat_tables(tables).to_pandas()
+        return pd.read_csv(file, usecols=columns, parse_dates=['candle_begin_time'])
+
+    def _find_gaps(self, times, interval):
+        """
+        在排序后的int64毫秒时间戳中一次性查找缺失的k线
+        返回每段缺失的(gap_start, gap_end, missing_bars)，gap_start/gap_end为第一根和最后一根缺失k线的开盘时间
+        """
+        times = np.asarray(times, dtype='int64')
+        if interval == '1mo':
+            # 月线按自然月对齐，用月份序号计算
+            steps = times.astype('datetime64[ms]').astype('datetime64[M]').astype('int64')
+        else:
+            steps = times // self.__interval_ms[interval]
+
+        diff = np.diff(steps)
+        index = np.flatnonzero(diff > 1)
+        missing_bars = diff[index] - 1
+
+        if interval == '1mo':
+            gap_start = (steps[index] + 1).astype('datetime64[M]').astype('datetime64[ms]').astype('int64')
+            gap_end = (steps[index + 1] - 1).astype('datetime64[M]').astype('datetime64[ms]').astype('int64')
+        else:
+            gap_start = times[index] + self.__interval_ms[interval]
+            gap_end = times[index + 1] - self.__interval_ms[interval]
+        return gap_start, gap_end, missing_bars
+
+    def _get_buckets(self, times, interval):
+        """
+        每根k线所在的高周期k线的开盘时间(毫秒)，按binance的UTC边界对齐
+        1d及以下和3d从1970-01-01起按周期对齐，周线从周一开始，月线按自然月
+        """
+        times = np.asarray(times, dtype='int64')
+        if interval == '1mo':
+            return times.astype('datetime64[ms]').astype('datetime64[M]').astype('datetime64[ms]').astype('int64')
+        interval_ms = self.__interval_ms[interval]
+        # 1970-01-01是周四，周一在4天之后
+        offset = 4 * 24 * 60 * 60 * 1000 if interval == '1w' else 0
+        return (times - offset) // interval_ms * interval_ms + offset
+
+    def _get_bucket_end(self, bucket, interval):
+        """
+        高周期k线的结束时间(毫秒)，即下一根k线的开盘时间
+        """
+        if interval == '1mo':
+            month = np.asarray(bucket, dtype='int64').astype('datetime64[ms]').astype('datetime64[M]')
+            return (month + 1).astype('datetime64[ms]').astype('int64')
+        return bucket + self.__interval_ms[interval]
+
+    def _resample(self, df, interval, base_interval=None):
+        """
+        把按时间排序的k线合成为更高的周期: 开高低收，成交量、成交额、成交笔数和主动买入量求和
+        最后一根k线数据不全(还没有走完)时不输出
+        """
+        base_ms = self.__interval_ms[base_interval or self.__intervals[0]]
+        times = df['candle_begin_time'].values.astype('datetime64[ms]').astype('int64')
+        if not len(times):
+            return df.iloc[:0]
+
+        buckets = self._get_buckets(times, interval)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+        ends = np.append(starts[1:], len(times)) - 1
+        if times[-1] + base_ms < self._get_bucket_end(buckets[-1], interval):
+            starts, ends = starts[:-1], ends[:-1]
+            if not len(starts):
+                return df.iloc[:0]
+
+        result = {'candle_begin_time': pd.to_datetime(buckets[starts], unit='ms')}
+        for column in self.__dtypes:
+            # reduceat的最后一段到数组末尾，先截掉不完整的k线
+            values = df[column].values[:ends[-1] + 1]
+            if column == 'open':
+                result[column] = values[starts]
+            elif column == 'close':
+                result[column] = values[ends]
+            elif column == 'high':
+                result[column] = np.maximum.reduceat(values, starts)
+            elif column == 'low':
+                result[column] = np.minimum.reduceat(values, starts)
+            else:
+                result[column] = np.add.reduceat(values, starts)
+        return pd.DataFrame(result)[self.__list].astype(self._get_dtypes())
+
+    def _resample_data(self, symbol_path):
+        """
+        由一个symbol清洗后的数据合成__resample_intervals中的所有周期，每个周期一个文件
+        """
+        file = self._get_data_file(symbol_path)
+        if not os.path.exists(file):
+            return
+        df = self._read_data(file)
+        base_interval = self.__intervals[0]
+        for interval in self.__resample_intervals:
+            if interval == base_interval:
+                continue
+            if interval == '1mo' and self.__output_format == 'bin':
+                # 月线不是定长周期，不能写入KlineStore
+                continue
+            resampled = self._resample(df, interval, base_interval)
+            self._write_data([resampled], self._get_data_file(symbol_path, interval), interval=interval)
+
+    def resample_multiprocess(self):
+        """
+        多进程由清洗后的1m(或1s)数据合成更高的周期，替代逐个周期下载
+        """
+        symbol_paths = self._get_all_symbol_path(".zip")
+        self._map_multiprocess('_resample_data', symbol_paths)
+
+    def _get_time_range(self, symbol_path):
+        """
+        一个symbol清洗后数据的起止时间(毫秒)，优先从manifest读取，没有数据时返回None
+        """
+        file = self._get_data_file(symbol_path)
+        if not os.path.exists(file):
+            return None
+        manifest = self._load_manifest(symbol_path, file)
+        if manifest is not None:
+            entries = [entry for entry in manifest['sources'].values() if entry['start'] is not None]
+            if entries:
+                return min(entry['start'] for entry in entries), max(entry['end'] for entry in entries)
+        times = self._read_data(file, columns=['candle_begin_time'])['candle_begin_time']
+        if times.empty:
+            return None
+        times = times.values.astype('datetime64[ms]').astype('int64')
+        return int(times[0]), int(times[-1])
+
+    def _get_range_parts(self, file, start, end):
+        """
+        与[start, end)(毫秒)有重叠的部分，每个部分从文件名的时间开始，到下一个部分的时间为止
+        """
+        parts = self._get_parts(file)
+        if not os.path.isdir(file):
+            return parts
+        starts = [int(pd.Timestamp(datetime.strptime(os.path.basename(part)[:12], '%Y%m%d%H%M')).value // 10 ** 6)
+                  for part in parts]
+        return [part for i, part in enumerate(parts)
+                if starts[i] < end and (i + 1 == len(parts) or starts[i + 1] > start)]
+
+    def _read_range(self, file, start, end, columns):
+        """
+        读取清洗后数据[start, end)之间的k线(毫秒)，不读取整个文件
+        bin按行号切片；parquet/arrow只读取时间有重叠的月份文件，再按时间过滤
+        """
+        columns = ['candle_begin_time'] + list(columns)
+        if file.endswith('.bin'):
+            return KlineStore(file).to_frame(start, end)[columns]
+        if not file.endswith(('.parquet', '.arrow')):
+            raise ValueError("csv不能按时间读取一部分，生成面板需要parquet、arrow或bin格式")
+        begin = pa.scalar(start, type=pa.timestamp('ms'))
+        stop = pa.scalar(end, type=pa.timestamp('ms'))
+        tables = [self._read_table(part, columns) for part in self._get_range_parts(file, start, end)]
+        if not tables:
+            return self._get_schema().empty_table().select(columns).to_pandas()
+        table = pa.concat_tables(tables)
+        times = table.column('candle_begin_time')
+        return table.filter(pc.and_(pc.greater_equal(times, begin), pc.less(times, stop))).to_pandas()
+
+    def _get_panel_path(self, market):
+        """
+        面板的保存路径: data/panel/<市场>/<周期>
+        """
+        return os.path.join(self.__data, 'panel', market, self.__intervals[0])
+
+    def _build_panel_month(self, task):
+        """
+        生成面板的一个月: 每列一个(k线数, symbol数)的矩阵，行是时间，列是symbol，按行连续存储
+        每个symbol只读取这个月的数据，按时间直接算出行号写入，不需要按时间join，没有数据的位置为NaN
+        task: (月份, symbol数, 这个月有数据的[(列号, symbol路径)], 面板路径)
+        """
+        month, num_symbols, symbols, panel_path = task
+        start = int(np.datetime64(month, 'M').astype('datetime64[ms]').astype('int64'))
+        end = int((np.datetime64(month, 'M') + 1).astype('datetime64[ms]').astype('int64'))
+        interval = self.__interval_ms[self.__intervals[0]]
+
+        blocks = {column: np.full(((end - start) // interval, num_symbols), np.nan, dtype=self.__float_dtype)
+                  for column in self.__panel_columns}
+        for j, symbol_path in symbols:
+            df = self._read_range(self._get_data_file(symbol_path), start, end, self.__panel_columns)
+            rows = (df['candle_begin_time'].values.astype('datetime64[ms]').astype('int64') - start) // interval
+            for column, block in blocks.items():
+                block[rows, j] = df[column].values
+
+        # 先写临时文件再替换，读取中的面板不会读到半个文件
+        for column, block in blocks.items():
+            file = os.path.join(panel_path, column, f'{month}.npy')
+            with open(file + '.tmp', 'wb') as f:
+                np.save(f, block)
+            os.replace(file + '.tmp', file)
+
+    def build_panel_multiprocess(self, market='spot'):
+        """
+        多进程把一个市场所有symbol清洗后的数据合成对齐的面板，每个进程生成一个月
+        market: spot, futures/um, futures/cm
+        面板按列、按月保存为.npy，另有panel.json记录symbol、周期和月份，用load_panel读取
+        """
+        if self.__output_format == 'csv':
+            # 在启动进程池之前检查，不让每个进程各自报错
+            raise ValueError("csv不能按时间读取一部分，生成面板需要parquet、arrow或bin格式")
+        market_path = os.path.normpath(os.path.join(self.__data, market))
+        symbol_paths = sorted(path for path in self._get_all_symbol_path(".zip") if os.path.dirname(path) == market_path)
+        ranges = self._map_multiprocess('_get_time_range', symbol_paths)
+        symbols = [(path, time_range) for path, time_range in zip(symbol_paths, ranges) if time_range is not None]
+        if not symbols:
+            print("没有清洗后的数据，无法生成面板")
+            return
+
+        # 按月份分配任务，每个月只读取这个月有数据的symbol
+        first = np.datetime64(min(start for _, (start, _) in symbols), 'ms').astype('datetime64[M]')
+        last = np.datetime64(max(end for _, (_, end) in symbols), 'ms').astype('datetime64[M]')
+        months = np.arange(first, last + 1)
+        panel_path = self._get_panel_path(market)
+        for column in self.__panel_columns:
+            os.makedirs(os.path.join(panel_path, column), exist_ok=True)
+        tasks = []
+        for month in months:
+            start = month.astype('datetime64[ms]').astype('int64')
+            end = (month + 1).astype('datetime64[ms]').astype('int64')
+            overlap = [(j, path) for j, (path, (first_time, last_time)) in enumerate(symbols)
+                       if first_time < end and last_time >= start]
+            tasks.append((str(month), len(symbols), overlap, panel_path))
+        # 每个进程一个月每列一个(k线数, symbol数)的矩阵，1m周期上千个symbol时每列约600MB，按内存上限限制进程数
+        interval = self.__interval_ms[self.__intervals[0]]
+        task_size = 31 * 24 * 60 * 60 * 1000 // interval * len(symbols) * np.dtype(self.__float_dtype).itemsize \
+            * len(self.__panel_columns)
+        workers = max(1, min(self.__worker_num, self.__panel_memory_budget // task_size))
+        self._map_multiprocess('_build_panel_month', tasks, workers=workers)
+
+        panel = {
+            'symbols': [os.path.basename(path) for path, _ in symbols],
+            'interval': self.__intervals[0],
+            'columns': self.__panel_columns,
+            'months': [str(month) for month in months],
+        }
+        with open(os.path.join(panel_path, 'panel.json'), 'w') as f:
+            json.dump(panel, f)
+
+    def load_panel(self, column, start=None, end=None, market='spot'):
+        """
+        读取面板的一列，返回(开盘时间毫秒数组, symbol列表, 矩阵)
+        start/end为时间字符串或Timestamp，只打开范围内的月份，每个月是内存映射，同一时间所有symbol连续存放
+        """
+        panel_path = self._get_panel_path(market)
+        with open(os.path.join(panel_path, 'panel.json')) as f:
+            panel = json.load(f)
+        interval = self.__interval_ms[panel['interval']]
+        start = pd.Timestamp(start).value // 10 ** 6 if start is not None else None
+        end = pd.Timestamp(end).value // 10 ** 6 if end is not None else None
+
+        times, blocks = [], []
+        for month in panel['months']:
+            month_start = int(np.datetime64(month, 'M').astype('datetime64[ms]').astype('int64'))
+            month_end = int((np.datetime64(month, 'M') + 1).astype('datetime64[ms]').astype('int64'))
+            if (start is not None and month_end <= start) or (end is not None and month_start >= end):
+                continue
+            block = np.load(os.path.join(panel_path, column, f'{month}.npy'), mmap_mode='r')
+            first = 0 if start is None else max(0, -(-(start - month_start) // interval))
+            last = len(block) if end is None else min(len(block), max(0, -(-(end - month_start) // interval)))
+            times.append(month_start + np.arange(first, last, dtype='int64') * interval)
+            blocks.append(block[first:last])
+
+        if not blocks:
+            return np.empty(0, dtype='int64'), panel['symbols'], np.empty((0, len(panel['symbols'])))
+        # 只在一个月内时直接返回内存映射上的切片
+        matrix = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+        return np.concatenate(times), panel['symbols'], matrix
+
+    def _share_array(self, array):
+        """
+        把numpy数组放进共享内存，返回(名称, 形状, 类型)，不经过pickle传回主进程
+        主进程用_take_shared_array读取并释放
+        """
+        # 共享内存由主进程释放，这个进程退出时不回收
+        size = max(array.nbytes, 1)
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(create=True, size=size, track=False)
+        else:
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        shm.close()
+        return shm.name, array.shape, array.dtype.str
+
+    def _take_shared_array(self, handle):
+        """
+        读取_share_array放进共享内存的数组，复制后释放共享内存
+        """
+        name, shape, dtype = handle
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            return np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _release_shared_array(self, handle):
+        """
+        不读取，直接释放_share_array放进共享内存的数组
+        """
+        shm = shared_memory.SharedMemory(name=handle[0])
+        shm.close()
+        shm.unlink()
+
+    def _check_data_integrity(self, symbol_path, interval=None):
+        """
+        检查数据完整性，没有缺失或还没有清洗后的数据时返回None
+        有缺失时返回(symbol, 路径, 共享内存)，共享内存中是每段缺失的gap_start, gap_end, missing_bars
+        """
+        # 获取清洗后的数据，只需要时间列
+        symbol = os.path.basename(symbol_path)
+        file = self._get_data_file(symbol_path)
+        if not os.path.exists(file):
+            print(f"{symbol} 还没有清洗后的数据，跳过完整性检查")
+            return None
+        df = self._read_data(file, columns=['candle_begin_time'])
+        times = df['candle_begin_time'].values.astype('datetime64[ms]').astype('int64')
+
+        # 检查数据完整性，清洗后的数据只有一个周期
+        gap_start, gap_end, missing_bars = self._find_gaps(times, interval or self.__intervals[0])
+        if len(missing_bars) == 0:
+            return None
+        return symbol, symbol_path, self._share_array(np.stack([gap_start, gap_end, missing_bars]))
+
+    def _get_missing(self, result):
+        """
+        把_check_data_integrity的结果整理成每段缺失一行的DataFrame
+        """
+        symbol, symbol_path, handle = result
+        gap_start, gap_end, missing_bars = self._take_shared_array(handle)
+        return pd.DataFrame({
+            "symbol": symbol,
+            "directory": symbol_path,
+            "gap_start": pd.to_datetime(gap_start, unit='ms'),
+            "gap_end": pd.to_datetime(gap_end, unit='ms'),
+            "missing_bars": missing_bars,
+        })
 
-        # # 如果有缺失的数据，记录下来
-        if len(missing) > 0:
-            # 记录缺失的数据
-            missing_start = min(missing)
-            missing_end = max(missing)
-            df = pd.DataFrame({"symbol": [symbol], "missing": [missing], "directory": symbol_path})
-            
-            # 保存到csv文件
-            file = os.path.join(self.__root, 'missing.csv')
-            df.to_csv(file, mode='a', header=False, index=False)
-        
     def check_data_integrity_multiprocess(self):
         """
-        多进程检查数据完整性
+        多进程检查数据完整性，结果由主进程一次写入missing.csv
         """
         # 获取所有zip文件夹的路径
-        symbol_paths = self._get_all_symbol_path()
+        symbol_paths = self._get_all_symbol_path(".zip")
+        # 有任务出错时释放其他任务已经放进共享内存的结果
+        results = self._map_multiprocess('_check_data_integrity', symbol_paths,
+                                         release=lambda result: self._release_shared_array(result[2]))
+        missing = [self._get_missing(result) for result in results if result is not None]
 
-        with ProcessPoolExecutor(max_workers=self.__worker_num) as pool:
-            # 显示进度条
-            with tqdm(total=len(symbol_paths)) as pbar:
-                # 提交任务
-                for _ in pool.map(self._check_data_integrity, symbol_paths):
-                    # 更新进度条
-                    pbar.update()
-            
         # 保存到csv文件
         file = os.path.join(self.__root, 'missing.csv')
-        try:
-            df = pd.read_csv(file, header=None, names=['symbol', 'missing_start', 'missing_end'])
-            df.to_csv(file, index=False)
+        if missing:
+            pd.concat(missing, ignore_index=True).to_csv(file, index=False)
             print("数据完整性已检查完毕，请查看missing.csv")
-        except FileNotFoundError:
+        else:
+            if os.path.exists(file):
+                os.remove(file)
             print("数据完整性已检查完毕，数据完整")
 
     def test(self):
         symbol_path = 'data\spot\ADABTC'
-        self._check_data_integrity(symbol_path)
+        result = self._check_data_integrity(symbol_path)
+        if result is not None:
+            print(self._get_missing(result))
         pass
         
         
 
 
-    # 交割合约最好是能有提前剪枝的算法，没有也没关系
     # 利用多进程去解压
 if __name__ == '__main__':
     print("=====main开始运行=====")
@@ -504,8 +1787,17 @@ if __name__ == '__main__':
     # 多进程解压
     # pbd.unzip_multiprocess()  
 
+    # 多进程直接从zip写入__output_format格式的存储(不解压)
+    # pbd.ingest_multiprocess()
+
     # 多进程清洗数据
     # pbd.clean_data_multiprocess()
 
+    # 多进程由清洗后的数据合成更高的周期
+    # pbd.resample_multiprocess()
+
+    # 多进程生成所有symbol对齐的面板(时间 × symbol)
+    # pbd.build_panel_multiprocess()
+
     # 多进程检查数据完整性
     pbd.check_data_integrity_multiprocess()
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+定长二进制k线存储，可以用numpy.memmap直接打开
+文件头记录起始时间、周期和列名，之后每根k线一条记录，缺失的k线填NaN
+k线的位置由时间直接算出: (时间 - 起始时间) // 周期，按时间切片不需要解析和查找
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+class KlineStore:
+    """
+    按时间索引的k线存储
+    store[start:end]返回[start, end)内的记录，是memmap上的视图，不复制数据
+    start/end可以是毫秒时间戳、datetime64、pd.Timestamp或时间字符串
+    """
+    magic = b'BPDKLINE'
+    header_size = 4096
+
+    def __init__(self, file):
+        self.file = file
+        with open(file, 'rb') as f:
+            header = f.read(self.header_size)
+        if not header.startswith(self.magic):
+            raise ValueError(f"{file} 不是k线存储文件")
+        meta = json.loads(header[len(self.magic):].rstrip(b'\0'))
+        self.start = meta['start']
+        self.interval = meta['interval']
+        self.columns = meta['columns']
+        self.dtype = self._get_dtype(self.columns)
+        rows = (os.path.getsize(file) - self.header_size) // self.dtype.itemsize
+        if rows:
+            self.data = np.memmap(file, dtype=self.dtype, mode='r', offset=self.header_size, shape=(rows,))
+        else:
+            self.data = np.empty(0, dtype=self.dtype)
+
+    @staticmethod
+    def _get_dtype(columns):
+        """
+        每根k线一条定长记录，所有列都用float64，缺失的k线可以填NaN
+        """
+        return np.dtype([(column, '<f8') for column in columns])
+
+    @staticmethod
+    def _to_ms(t):
+        """
+        把各种时间表示转换成毫秒时间戳
+        """
+        if isinstance(t, (int, np.integer)):
+            return int(t)
+        return int(pd.Timestamp(t).value // 10 ** 6)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def end(self):
+        """
+        最后一根k线之后的时间，即[start, end)覆盖全部数据
+        """
+        return self.start + len(self) * self.interval
+
+    def index_of(self, t):
+        """
+        某个时间所在k线的行号，不检查是否越界
+        """
+        return (self._to_ms(t) - self.start) // self.interval
+
+    def times(self, start=None, end=None):
+        """
+        [start, end)内每根k线的开盘时间(毫秒)
+        """
+        first, last = self._get_range(slice(start, end))
+        return self.start + np.arange(first, last, dtype='int64') * self.interval
+
+    def _get_range(self, key):
+        """
+        把按时间的切片转换成行号范围，超出数据范围的部分截掉
+        """
+        if key.step is not None:
+            raise ValueError("按时间切片不支持step")
+        first = 0 if key.start is None else -(-(self._to_ms(key.start) - self.start) // self.interval)
+        last = len(self) if key.stop is None else -(-(self._to_ms(key.stop) - self.start) // self.interval)
+        first = min(max(first, 0), len(self))
+        last = min(max(last, first), len(self))
+        return first, last
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            first, last = self._get_range(key)
+            return self.data[first:last]
+        index = self.index_of(key)
+        if not 0 <= index < len(self):
+            raise KeyError(key)
+        return self.data[index]
+
+    def to_frame(self, start=None, end=None, dropna=True):
+        """
+        把[start, end)内的数据转换成DataFrame，dropna时去掉缺失的k线
+        """
+        df = pd.DataFrame(self[start:end])
+        df.insert(0, 'candle_begin_time', pd.to_datetime(self.times(start, end), unit='ms'))
+        if dropna and len(df):
+            df = df[~np.isnan(df[self.columns[0]].values)].reset_index(drop=True)
+        return df
+
+    @classmethod
+    def write(cls, file, frames, interval, columns, append=False):
+        """
+        按时间顺序写入k线，frames为按时间顺序的DataFrame，需要有candle_begin_time和columns列
+        append: 追加到已有文件后面，新数据必须在已有数据之后，中间缺失的k线填NaN
+        返回写入后的总行数
+        """
+        dtype = cls._get_dtype(columns)
+        start = None
+        rows = 0
+        if append:
+            store = cls(file)
+            if store.interval != interval or store.columns != list(columns):
+                raise ValueError(f"{file} 的周期或列与新数据不同")
+            start, rows = store.start, len(store)
+            del store
+
+        with open(file, 'r+b' if append else 'wb') as f:
+            for df in frames:
+                if df.empty:
+                    continue
+                times = df['candle_begin_time'].values.astype('datetime64[ms]').astype('int64')
+                if start is None:
+                    # 起始时间取第一根k线的开盘时间，周线等不从1970-01-01对齐的周期也适用
+                    start = int(times[0])
+                    meta = json.dumps({'start': start, 'interval': interval, 'columns': list(columns)}).encode()
+                    f.write((cls.magic + meta).ljust(cls.header_size, b'\0'))
+
+                index = (times - start) // interval
+                if index[0] < rows:
+                    raise ValueError(f"{file} 新数据不在已有数据之后")
+                # 从上一根k线之后到这个块最后一根k线，一次性写入，缺失的位置保持NaN
+                block = np.full(int(index[-1]) + 1 - rows, np.nan, dtype=dtype)
+                for column in columns:
+                    block[column][index - rows] = df[column].values
+                f.seek(cls.header_size + rows * dtype.itemsize)
+                f.write(block.tobytes())
+                rows = int(index[-1]) + 1
+        return rows
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+"""
+  script to build time, tick, volume or dollar bars from downloaded trades or aggTrades files.
+  files are read in chunks, straight from the zips, so memory does not grow with the file size.
+
+  e.g. ./aggregate-trades.py data/spot/monthly/aggTrades/BTCUSDT/*.zip -bar dollar -size 1000000 -o BTCUSDT-dollar.csv
+
+"""
+import sys
+from datetime import *
+from argparse import ArgumentParser, RawTextHelpFormatter
+from bars import BAR_TYPES, aggregate_trades, parse_bar_size
+
+def write_bars(files, bar_type, size, output, chunksize):
+  start = datetime.now()
+  rows = 0
+  count = 0
+  with open(output, 'w') as f:
+    for i, (read, bars) in enumerate(aggregate_trades(files, bar_type, size, chunksize)):
+      bars.to_csv(f, header=i == 0, index=False)
+      rows += read
+      count += len(bars)
+      elapsed = (datetime.now() - start).total_seconds() or 1
+      sys.stdout.write("\r{} trades, {} bars, {:.0f} rows/s".format(rows, count, rows / elapsed))
+      sys.stdout.flush()
+  print("\nSaved {} bars to {}".format(count, output))
+
+if __name__ == "__main__":
+  parser = ArgumentParser(description="This is a script to aggregate trades or aggTrades into bars", formatter_class=RawTextHelpFormatter)
+  parser.add_argument(
+      'files', nargs='+',
+      help='Trades or aggTrades files (.zip or .csv) of one symbol, read in time order')
+  parser.add_argument(
+      '-bar', dest='bar_type', default='time', choices=BAR_TYPES,
+      help='Bar type, default time')
+  parser.add_argument(
+      '-size', dest='size', required=True,
+      help='Bar size: an interval like 1m or 1h for time bars,\nnumber of trades, base volume or quote volume for tick, volume and dollar bars')
+  parser.add_argument(
+      '-o', dest='output', required=True,
+      help='Output csv file')
+  parser.add_argument(
+      '-chunksize', dest='chunksize', default=1000000, type=int,
+      help='Number of trades read at a time, default 1000000')
+  args = parser.parse_args(sys.argv[1:])
+
+  write_bars(args.files, args.bar_type, parse_bar_size(args.bar_type, args.size), args.output, args.chunksize)
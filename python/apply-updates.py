@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""
+  script to apply the aggTrades correction manifests published under updates/.
+  only files whose local sha256 still matches the original checksum are downloaded again.
+  set the absolute path destination folder for STORE_DIRECTORY, and run
+
+  e.g. STORE_DIRECTORY=/data/ ./apply-updates.py
+
+"""
+import os, sys, io, csv, glob
+import zipfile
+from argparse import ArgumentParser, RawTextHelpFormatter
+from enums import *
+from utility import download_files, get_cache, get_download_url, get_file_sha256, get_path, get_save_path
+
+UPDATES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'updates')
+
+def read_manifest(manifest):
+  # yields one row at a time from a manifest csv, or from the csv files inside a manifest zip
+  if manifest.endswith('.zip'):
+    with zipfile.ZipFile(manifest) as zip_file:
+      for name in zip_file.namelist():
+        if name.endswith('.csv') and not name.startswith('__MACOSX'):
+          with zip_file.open(name) as f:
+            yield from csv.reader(io.TextIOWrapper(f, encoding='utf-8'))
+  else:
+    with open(manifest, newline='') as f:
+      yield from csv.reader(f)
+
+def get_updates(manifest, trading_type):
+  # (base_path, file_name, original sha256, new sha256) for every corrected file
+  # newer manifests give the full path, older ones only the file name of a monthly aggTrades file
+  for row in read_manifest(manifest):
+    if len(row) < 3 or row[0] in ('File', 'File Path'):
+      continue
+    file_path, original, new = row[:3]
+    if '/' in file_path:
+      base_path, file_name = file_path.rsplit('/', 1)
+      base_path += '/'
+    else:
+      file_name = file_path if file_path.endswith('.zip') else file_path + '.zip'
+      symbol = file_name.split('-')[0]
+      base_path = get_path(trading_type, 'aggTrades', 'monthly', symbol)
+    yield base_path, file_name, original.split()[0].lower(), new.split()[0].lower()
+
+def find_local_file(base_path, file_name, folder):
+  # (save_path, date_range) of the downloaded copy, or None when the file was never downloaded
+  # a -startDate/-endDate download is saved under <base_path>/<start>_<end>/, the download cache knows that path
+  _, save_path = get_save_path(base_path, file_name, folder=folder)
+  if os.path.exists(save_path):
+    return save_path, None
+  entry = get_cache().get(get_download_url(base_path + file_name))
+  if not entry or not os.path.exists(entry['path']):
+    return None
+  date_range = os.path.basename(os.path.dirname(entry['path'])).replace('_', ' ')
+  _, save_path = get_save_path(base_path, file_name, date_range, folder)
+  if os.path.abspath(save_path) != entry['path']:
+    # saved under another -folder
+    return None
+  return save_path, date_range
+
+def get_local_sha256(download_url, save_path):
+  # reuse the hash recorded by the download cache when it describes this very file
+  entry = get_cache().get(download_url)
+  if entry and entry['sha256'] and entry['path'] == os.path.abspath(save_path) \
+      and entry['size'] == os.path.getsize(save_path):
+    return entry['sha256']
+  return get_file_sha256(save_path).hexdigest()
+
+def apply_updates(manifests, trading_type, folder, concurrency):
+  # a file can be corrected more than once, so every superseded checksum counts as outdated
+  files = {}
+  for manifest in sorted(manifests, key=os.path.basename):
+    print("reading {}".format(manifest))
+    for base_path, file_name, original, new in get_updates(manifest, trading_type):
+      outdated = files[base_path + file_name][2] if base_path + file_name in files else set()
+      outdated.add(original)
+      outdated.discard(new)
+      files[base_path + file_name] = (base_path, file_name, outdated, new)
+
+  jobs = []
+  counts = {'outdated': 0, 'updated': 0, 'missing': 0, 'unknown': 0}
+  for base_path, file_name, outdated, new in files.values():
+    local_file = find_local_file(base_path, file_name, folder)
+    if local_file is None:
+      counts['missing'] += 1
+      continue
+    save_path, date_range = local_file
+    local = get_local_sha256(get_download_url(base_path + file_name), save_path)
+    if local in outdated:
+      counts['outdated'] += 1
+      jobs.append((base_path, file_name, date_range, folder, True, False, True))
+    elif local == new:
+      counts['updated'] += 1
+    else:
+      counts['unknown'] += 1
+      print("\nchecksum matches neither version, left as is: {}".format(save_path))
+
+  print("{outdated} outdated, {updated} already updated, {missing} not downloaded, {unknown} unknown".format(**counts))
+  download_files(jobs, concurrency)
+  return jobs
+
+if __name__ == "__main__":
+  parser = ArgumentParser(description="This is a script to download again the files listed in the correction manifests", formatter_class=RawTextHelpFormatter)
+  parser.add_argument(
+      'manifests', nargs='*', default=sorted(glob.glob(os.path.join(UPDATES_DIR, '*_updates.*'))),
+      help='Correction manifests (.csv or .zip), default all manifests in updates/')
+  parser.add_argument(
+      '-t', dest='type', default='spot', choices=TRADING_TYPE,
+      help='Trading type of manifests that only list file names, default spot')
+  parser.add_argument(
+      '-folder', dest='folder',
+      help='Directory the data was downloaded to')
+  parser.add_argument(
+      '-concurrency', '--concurrency', dest='concurrency', default=1, type=int,
+      help='Number of files to download at the same time, default 1')
+  args = parser.parse_args(sys.argv[1:])
+
+  apply_updates(args.manifests, args.type, args.folder, args.concurrency)
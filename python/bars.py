@@ -0,0 +1,125 @@
+import os, re
+import zipfile
+import numpy as np
+import pandas as pd
+
+BAR_TYPES = ['time', 'tick', 'volume', 'dollar']
+BAR_COLUMNS = ['open_time', 'close_time', 'open', 'high', 'low', 'close', 'volume', 'quote_volume', 'count']
+# column positions of price, quantity and time in the published files
+TRADE_COLUMNS = {'trades': (1, 2, 4), 'aggTrades': (1, 2, 5)}
+UNITS_MS = {'s': 1000, 'm': 60 * 1000, 'h': 60 * 60 * 1000, 'd': 24 * 60 * 60 * 1000}
+
+def parse_bar_size(bar_type, size):
+  # time bars take an interval like 30s, 5m or 1h, the others a number of trades, base or quote volume
+  if bar_type == 'time':
+    match = re.fullmatch(r'(\d+)([smhd])', size)
+    if not match:
+      raise ValueError("time bar size must look like 30s, 5m, 1h or 1d: {}".format(size))
+    return int(match.group(1)) * UNITS_MS[match.group(2)]
+  return float(size)
+
+def get_data_type(file_name):
+  return 'aggTrades' if '-aggTrades-' in os.path.basename(file_name) else 'trades'
+
+def read_trades(file_name, chunksize=1000000):
+  # yields (price, quantity, time in ms) arrays of at most `chunksize` rows, from a csv or straight from its zip
+  price, qty, time = TRADE_COLUMNS[get_data_type(file_name)]
+  if file_name.endswith('.zip'):
+    with zipfile.ZipFile(file_name) as zip_file:
+      with zip_file.open(zip_file.namelist()[0]) as f:
+        yield from _read_chunks(f, price, qty, time, chunksize)
+  else:
+    with open(file_name, 'rb') as f:
+      yield from _read_chunks(f, price, qty, time, chunksize)
+
+def _read_chunks(f, price, qty, time, chunksize):
+  # newer futures files start with a header row, the others do not
+  header = 0 if not f.peek(1)[:1].isdigit() else None
+  reader = pd.read_csv(f, header=header, usecols=[price, qty, time], chunksize=chunksize,
+    dtype={price: 'float64', qty: 'float64', time: 'int64'} if header is None else None)
+  for df in reader:
+    # usecols keeps the file order: price, quantity, time
+    times = df.iloc[:, 2].to_numpy('int64')
+    # spot files use microsecond timestamps since 2025
+    if len(times) and times[0] >= 10 ** 14:
+      times = times // 1000
+    yield df.iloc[:, 0].to_numpy('float64'), df.iloc[:, 1].to_numpy('float64'), times
+
+class BarAggregator:
+  # builds bars from trades chunk by chunk, the bar still open at the end of a chunk is carried to the next one,
+  # so bars span chunk and file boundaries and memory only depends on the chunk size
+  # volume and dollar bars are cut on a fixed grid of the running total: a trade belongs to the bar its total started in
+
+  def __init__(self, bar_type, size):
+    if bar_type not in BAR_TYPES:
+      raise ValueError("bar type must be one of {}".format(BAR_TYPES))
+    self.bar_type = bar_type
+    self.size = parse_bar_size(bar_type, size) if isinstance(size, str) else size
+    self.total = 0.0  # running trades, volume or quote volume before the current chunk
+    self.pending = None  # (bar id, values) of the bar still open
+
+  def _get_bar_ids(self, price, qty, time):
+    if self.bar_type == 'time':
+      return time // self.size
+    if self.bar_type == 'tick':
+      measure = np.ones(len(price))
+    elif self.bar_type == 'volume':
+      measure = qty
+    else:
+      measure = price * qty
+    running = np.cumsum(measure)
+    before = self.total + running - measure
+    self.total += running[-1]
+    return (before // self.size).astype('int64')
+
+  def update(self, price, qty, time):
+    # returns the bars completed by this chunk
+    if not len(price):
+      return pd.DataFrame(columns=BAR_COLUMNS)
+    ids = self._get_bar_ids(price, qty, time)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+    ends = np.append(starts[1:], len(ids)) - 1
+    quote = price * qty
+    bars = {
+      'open_time': time[starts],
+      'close_time': time[ends],
+      'open': price[starts],
+      'high': np.maximum.reduceat(price, starts),
+      'low': np.minimum.reduceat(price, starts),
+      'close': price[ends],
+      'volume': np.add.reduceat(qty, starts),
+      'quote_volume': np.add.reduceat(quote, starts),
+      'count': np.diff(np.append(starts, len(ids))),
+    }
+
+    if self.pending is not None:
+      pending_id, pending = self.pending
+      if ids[0] == pending_id:
+        # the first bar of the chunk continues the bar left open by the previous one
+        bars['open_time'][0] = pending['open_time']
+        bars['open'][0] = pending['open']
+        bars['high'][0] = max(bars['high'][0], pending['high'])
+        bars['low'][0] = min(bars['low'][0], pending['low'])
+        for column in ('volume', 'quote_volume', 'count'):
+          bars[column][0] += pending[column]
+      else:
+        bars = {column: np.insert(values, 0, pending[column]) for column, values in bars.items()}
+
+    self.pending = (ids[-1], {column: values[-1] for column, values in bars.items()})
+    return pd.DataFrame({column: values[:-1] for column, values in bars.items()}, columns=BAR_COLUMNS)
+
+  def flush(self):
+    # the last, possibly incomplete, bar
+    if self.pending is None:
+      return pd.DataFrame(columns=BAR_COLUMNS)
+    bars = pd.DataFrame({column: [value] for column, value in self.pending[1].items()}, columns=BAR_COLUMNS)
+    self.pending = None
+    return bars
+
+def aggregate_trades(files, bar_type, size, chunksize=1000000):
+  # yields (rows read, completed bars) per chunk over the files in time order
+  aggregator = BarAggregator(bar_type, size)
+  for file_name in sorted(files, key=os.path.basename):
+    for price, qty, time in read_trades(file_name, chunksize):
+      yield len(price), aggregator.update(price, qty, time)
+  yield 0, aggregator.flush()
@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import threading
+from datetime import *
+
+class DownloadCache:
+  # index of downloaded files keyed by url: etag, size and sha256 of the content and where it was saved
+  # shared by every -folder and date range under the same store directory
+
+  def __init__(self, path):
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(path, check_same_thread=False)
+    with self.lock, self.connection:
+      self.connection.execute(
+        "CREATE TABLE IF NOT EXISTS files ("
+        "url TEXT PRIMARY KEY, etag TEXT, size INTEGER, sha256 TEXT, path TEXT, checked_at TEXT)")
+      self.connection.execute("CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)")
+
+  def get(self, url):
+    with self.lock:
+      row = self.connection.execute(
+        "SELECT url, etag, size, sha256, path, checked_at FROM files WHERE url = ?", (url,)).fetchone()
+    if row is None:
+      return None
+    return dict(zip(['url', 'etag', 'size', 'sha256', 'path', 'checked_at'], row))
+
+  def put(self, url, etag, size, sha256, path):
+    with self.lock, self.connection:
+      self.connection.execute(
+        "INSERT OR REPLACE INTO files (url, etag, size, sha256, path, checked_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (url, etag, size, sha256, os.path.abspath(path), datetime.now().isoformat()))
+
+  def touch(self, url):
+    with self.lock, self.connection:
+      self.connection.execute("UPDATE files SET checked_at = ? WHERE url = ?", (datetime.now().isoformat(), url))
+
+  def find_content(self, sha256, size, exclude=None):
+    # path of another stored file with the same content, if one is still on disk
+    with self.lock:
+      rows = self.connection.execute(
+        "SELECT path FROM files WHERE sha256 = ? AND size = ?", (sha256, size)).fetchall()
+    for (path,) in rows:
+      if path != exclude and os.path.exists(path) and os.path.getsize(path) == size:
+        return path
+    return None
+
+class SymbolCache:
+  # known symbols per trading type, live or delisted, with the first and last month they have data for
+  # months are YYYY-MM strings, None when unknown, so the planner only prunes what it is sure about
+
+  def __init__(self, path):
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(path, check_same_thread=False)
+    with self.lock, self.connection:
+      self.connection.execute(
+        "CREATE TABLE IF NOT EXISTS symbols ("
+        "trading_type TEXT, symbol TEXT, first_month TEXT, last_month TEXT, live INTEGER, "
+        "PRIMARY KEY (trading_type, symbol))")
+      self.connection.execute(
+        "CREATE TABLE IF NOT EXISTS symbol_refreshes (trading_type TEXT PRIMARY KEY, refreshed_at TEXT)")
+
+  def get_symbols(self, trading_type):
+    with self.lock:
+      rows = self.connection.execute(
+        "SELECT symbol FROM symbols WHERE trading_type = ? ORDER BY symbol", (trading_type,)).fetchall()
+    return [symbol for (symbol,) in rows]
+
+  def get_bounds(self, trading_type):
+    # {symbol: (first_month, last_month)}, read once by the planner instead of once per file
+    with self.lock:
+      rows = self.connection.execute(
+        "SELECT symbol, first_month, last_month FROM symbols WHERE trading_type = ?", (trading_type,)).fetchall()
+    return {symbol: (first_month, last_month) for symbol, first_month, last_month in rows}
+
+  def get_refreshed_at(self, trading_type):
+    with self.lock:
+      row = self.connection.execute(
+        "SELECT refreshed_at FROM symbol_refreshes WHERE trading_type = ?", (trading_type,)).fetchone()
+    return datetime.fromisoformat(row[0]) if row else None
+
+  def seed(self, trading_type, symbols):
+    # names from the bundled symbol lists, bounds already known are kept
+    with self.lock, self.connection:
+      self.connection.executemany(
+        "INSERT OR IGNORE INTO symbols (trading_type, symbol, first_month, last_month, live) VALUES (?, ?, ?, ?, 0)",
+        [(trading_type, symbol, None, last_month) for symbol, last_month in symbols])
+
+  def refresh(self, trading_type, symbols):
+    # symbols is {symbol: (first_month, last_month)} of every live symbol, the ones no longer listed are
+    # marked delisted and their last month is capped at the current one
+    # a symbol listed again keeps its earliest first month, its older data is still published
+    month = date.today().strftime("%Y-%m")
+    with self.lock, self.connection:
+      self.connection.execute(
+        "UPDATE symbols SET live = 0, last_month = COALESCE(last_month, ?) WHERE trading_type = ? AND live = 1",
+        (month, trading_type))
+      self.connection.executemany(
+        "INSERT INTO symbols (trading_type, symbol, first_month, last_month, live) VALUES (?, ?, ?, ?, 1) "
+        "ON CONFLICT (trading_type, symbol) DO UPDATE SET live = 1, "
+        "first_month = COALESCE(MIN(first_month, excluded.first_month), first_month, excluded.first_month), "
+        "last_month = excluded.last_month",
+        [(trading_type, symbol, first_month, last_month) for symbol, (first_month, last_month) in symbols.items()])
+      self.connection.execute(
+        "INSERT OR REPLACE INTO symbol_refreshes (trading_type, refreshed_at) VALUES (?, ?)",
+        (trading_type, datetime.now().isoformat()))
+
+  def set_listed_bounds(self, trading_type, bounds):
+    # bounds is {symbol: (first_month, last_month)} of the archives S3 lists, they are real data and replace
+    # the guesses: the earliest first month is kept, live symbols keep no last month
+    with self.lock, self.connection:
+      self.connection.executemany(
+        "INSERT INTO symbols (trading_type, symbol, first_month, last_month, live) VALUES (?, ?, ?, ?, 0) "
+        "ON CONFLICT (trading_type, symbol) DO UPDATE SET "
+        "first_month = COALESCE(MIN(first_month, excluded.first_month), excluded.first_month), "
+        "last_month = CASE WHEN live = 1 THEN last_month ELSE COALESCE(excluded.last_month, last_month) END",
+        [(trading_type, symbol, first_month, last_month) for symbol, (first_month, last_month) in bounds.items()])
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""
+  script to download several datasets in one run.
+  the files of every dataset and symbol are queued together and downloaded by one pool of workers.
+  set the absolute path destination folder for STORE_DIRECTORY, and run
+
+  e.g. STORE_DIRECTORY=/data/ ./download.py -t um -data klines aggTrades markPriceKlines
+
+"""
+import sys
+from enums import *
+from utility import download_files, get_all_symbols, get_parser, get_dates, get_range_plan, is_range_plan, get_monthly_jobs, get_daily_jobs
+
+
+def get_jobs(trading_type, datasets, symbols, intervals, years, months, dates, start_date, end_date, folder, checksum, revalidate, monthly, daily, plan=False):
+  # the datasets of a symbol are queued next to each other, so they are downloaded side by side
+  jobs = []
+  for symbol in symbols:
+    for dataset in datasets:
+      dataset_intervals = intervals if dataset in KLINE_DATASETS else None
+      if monthly:
+        jobs += get_monthly_jobs(trading_type, dataset, symbol, dataset_intervals, years, months, start_date, end_date, folder, checksum, revalidate, plan)
+      if daily:
+        jobs += get_daily_jobs(trading_type, dataset, symbol, dataset_intervals, dates, start_date, end_date, folder, checksum, revalidate, plan)
+  return jobs
+
+def run(args, datasets):
+  # the __main__ of every download script: the files of all datasets and symbols go to one download_files() call,
+  # monthly files are skipped when dates are given, and a date range is covered by monthly archives
+  # for its complete months and daily files for the rest
+  if not args.symbols:
+    print("fetching all symbols from exchange")
+    symbols = get_all_symbols(args.type)
+  else:
+    symbols = args.symbols
+
+  years, dates, plan = args.years, get_dates(args.dates), False
+  if is_range_plan(args):
+    years, dates = get_range_plan(args.startDate, args.endDate)
+    plan = True
+  jobs = get_jobs(args.type, datasets, symbols, getattr(args, 'intervals', None), years, args.months, dates,
+    args.startDate, args.endDate, args.folder, args.checksum, args.revalidate,
+    args.skip_monthly == 0 and not args.dates, args.skip_daily == 0, plan)
+  print("Found {} symbols, queued {} files of {}".format(len(symbols), len(jobs), ", ".join(datasets)))
+  return download_files(jobs, args.concurrency)
+
+if __name__ == "__main__":
+    parser = get_parser('market')
+    parser.add_argument(
+      '-i', dest='intervals', default=INTERVALS, nargs='+', choices=INTERVALS,
+      help='single kline interval or multiple intervals separated by space, used by the kline datasets')
+    parser.add_argument(
+      '-data', dest='datasets', required=True, nargs='+', choices=DATASETS,
+      help='Single dataset or multiple datasets separated by space\n-data klines aggTrades means to download klines and aggTrades')
+    parser.set_defaults(concurrency=8)
+    args = parser.parse_args(sys.argv[1:])
+
+    datasets = args.datasets
+    if args.type == 'spot':
+      datasets = [dataset for dataset in datasets if dataset not in FUTURES_DATASETS]
+      if len(datasets) < len(args.datasets):
+        print("skipping {}, only available for futures".format(", ".join(set(args.datasets) - set(datasets))))
+    run(args, datasets)
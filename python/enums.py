@@ -9,3 +9,9 @@ PERIOD_START_DATE = '2020-01-01'
 BASE_URL = 'https://data.binance.vision/'
 START_DATE = date(int(YEARS[0]), MONTHS[0], 1)
 END_DATE = datetime.date(datetime.now())
+DATASETS = ["klines", "trades", "aggTrades", "indexPriceKlines", "markPriceKlines", "premiumIndexKlines"]
+KLINE_DATASETS = ["klines", "indexPriceKlines", "markPriceKlines", "premiumIndexKlines"]
+FUTURES_DATASETS = ["indexPriceKlines", "markPriceKlines", "premiumIndexKlines"]
+SYMBOLS_TTL = timedelta(days=1)
+LISTING_URL = 'https://s3-ap-northeast-1.amazonaws.com/data.binance.vision'
+PUBLICATION_LAG = timedelta(days=7)
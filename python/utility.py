@@ -1,10 +1,34 @@
 import os, sys, re, shutil
 import json
+import hashlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import *
+import urllib.parse
 import urllib.request
+from xml.etree import ElementTree
 from argparse import ArgumentParser, RawTextHelpFormatter, ArgumentTypeError
 from enums import *
+from cache import DownloadCache, SymbolCache
+
+_cache = None
+_symbol_cache = None
+_symbol_bounds = {}
+_checked_symbols = set()
+_cache_lock = threading.Lock()
+
+# bytes read and written at a time while downloading, set DOWNLOAD_BLOCK_SIZE to tune it
+BLOCK_SIZE = int(os.environ.get('DOWNLOAD_BLOCK_SIZE', 1024 * 1024))
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+# symbol lists shipped with the repo, used to seed the symbol cache
+SYMBOL_LISTS = {
+  'spot': ['data/symbols/symbols.txt', 'shell/spot_symbol.txt'],
+  'um': ['data/symbols/um-futures-symbols.txt', 'shell/um_symbol.txt'],
+  'cm': ['data/symbols/cm-futures-symbols.txt', 'shell/cm_symbol.txt'],
+}
 
 def get_destination_dir(file_url, folder=None):
   store_directory = os.environ.get('STORE_DIRECTORY')
@@ -17,57 +41,432 @@ def get_destination_dir(file_url, folder=None):
 def get_download_url(file_url):
   return "{}{}".format(BASE_URL, file_url)
 
-def get_all_symbols(type):
+def get_live_symbols(type):
+  # {symbol: (first_month, last_month)} of the symbols exchangeInfo lists today,
+  # futures give their onboard date, delivery contracts expire in the month in their name
   if type == 'um':
     response = urllib.request.urlopen("https://fapi.binance.com/fapi/v1/exchangeInfo").read()
   elif type == 'cm':
     response = urllib.request.urlopen("https://dapi.binance.com/dapi/v1/exchangeInfo").read()
   else:
     response = urllib.request.urlopen("https://api.binance.com/api/v3/exchangeInfo").read()
-  return list(map(lambda symbol: symbol['symbol'], json.loads(response)['symbols']))
+  symbols = {}
+  for symbol in json.loads(response)['symbols']:
+    onboard = symbol.get('onboardDate')
+    first_month = datetime.fromtimestamp(onboard / 1000, timezone.utc).strftime("%Y-%m") if onboard else None
+    symbols[symbol['symbol']] = (first_month, get_contract_month(symbol['symbol']))
+  return symbols
 
-def download_file(base_path, file_name, date_range=None, folder=None):
-  download_path = "{}{}".format(base_path, file_name)
+def get_contract_month(symbol):
+  # delivery contracts like BTCUSD_200925 have no data after their delivery month
+  match = re.search(r'_(\d{2})(\d{2})\d{2}$', symbol)
+  return "20{}-{}".format(*match.groups()) if match else None
+
+def read_symbol_lists(type):
+  # (symbol, last_month) from the symbol lists shipped with the repo, they include delisted symbols
+  symbols = set()
+  for file_name in SYMBOL_LISTS[type]:
+    path = os.path.join(REPO_DIR, file_name)
+    if os.path.exists(path):
+      with open(path) as f:
+        symbols.update(line.strip().upper() for line in f if line.strip())
+  return [(symbol, get_contract_month(symbol)) for symbol in sorted(symbols)]
+
+def get_all_symbols(type):
+  # live and delisted symbols from the symbol cache, exchangeInfo is only asked again once the cache
+  # is older than SYMBOLS_TTL, and when it cannot be reached the cached list is used as is
+  cache = get_symbol_cache()
+  if not cache.get_symbols(type):
+    cache.seed(type, read_symbol_lists(type))
+  refreshed_at = cache.get_refreshed_at(type)
+  if refreshed_at is None or datetime.now() - refreshed_at > SYMBOLS_TTL:
+    try:
+      cache.refresh(type, get_live_symbols(type))
+      _symbol_bounds.pop(type, None)
+    except (OSError, ValueError, KeyError) as e:
+      print("Could not refresh {} symbols, using the cached list: {}".format(type, e))
+  symbols = cache.get_symbols(type)
+  fill_symbol_bounds(type, symbols)
+  return symbols
+
+def get_symbol_cache():
+  global _symbol_cache
+  with _cache_lock:
+    if _symbol_cache is None:
+      _symbol_cache = SymbolCache(get_destination_dir('download-cache.sqlite'))
+  return _symbol_cache
+
+def get_listed_months(trading_type, symbol):
+  # YYYY-MM of the monthly aggTrades archives S3 lists for a symbol, every dataset of a symbol
+  # is published for the same months, so they give its real first and last month
+  params = {'delimiter': '/', 'prefix': get_path(trading_type, 'aggTrades', 'monthly', symbol)}
+  months = set()
+  while True:
+    response = urllib.request.urlopen("{}?{}".format(LISTING_URL, urllib.parse.urlencode(params))).read()
+    root = ElementTree.fromstring(response)
+    keys = [element.text for element in root.findall('{*}Contents/{*}Key')]
+    months.update(match.group(1) for match in map(re.compile(r'-(\d{4}-\d{2})\.zip$').search, keys) if match)
+    if root.findtext('{*}IsTruncated') != 'true' or not keys:
+      return sorted(months)
+    params['marker'] = keys[-1]
+
+def is_closed(month):
+  # the month after `month` is over and its archives had PUBLICATION_LAG to appear,
+  # only then does a missing next month mean `month` was the symbol's last one
+  year, month = [int(x) for x in month.split('-')]
+  next_month_end = date(year + (month + 1) // 12, (month + 1) % 12 + 1, 1)
+  return date.today() >= next_month_end + PUBLICATION_LAG
+
+def fill_symbol_bounds(trading_type, symbols, concurrency=8):
+  # exchangeInfo gives no first month for spot symbols and nothing for delisted ones, their bounds
+  # are read from the S3 listing once and kept in the symbol cache, each symbol is checked once per run
+  # and a failed listing is tried again on the next one
+  symbols = [symbol.upper() for symbol in symbols if (trading_type, symbol.upper()) not in _checked_symbols]
+  if not symbols:
+    return
+  _checked_symbols.update((trading_type, symbol) for symbol in symbols)
+  known = get_symbol_cache().get_bounds(trading_type)
+  missing = [symbol for symbol in symbols if known.get(symbol, (None, None))[0] is None]
+  if not missing:
+    return
+
+  def list_months(symbol):
+    try:
+      return get_listed_months(trading_type, symbol)
+    except (OSError, ElementTree.ParseError) as e:
+      print("Could not list the months of {} {}: {}".format(trading_type, symbol, e))
+      return None
+
+  if len(missing) > 1:
+    print("Listing the months of {} {} symbols".format(len(missing), trading_type))
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    listed = list(executor.map(list_months, missing))
+  bounds = {}
+  for symbol, months in zip(missing, listed):
+    if months:
+      last_month = get_contract_month(symbol) or (months[-1] if is_closed(months[-1]) else None)
+      bounds[symbol] = (months[0], last_month)
+  get_symbol_cache().set_listed_bounds(trading_type, bounds)
+  _symbol_bounds.pop(trading_type, None)
+
+def get_symbol_bounds(trading_type, symbol):
+  # (first_month, last_month) of a symbol, None where unknown, read from the symbol cache once per trading type,
+  # a symbol without a first month is looked up in the S3 listing first
+  fill_symbol_bounds(trading_type, [symbol])
+  if trading_type not in _symbol_bounds:
+    _symbol_bounds[trading_type] = get_symbol_cache().get_bounds(trading_type)
+  return _symbol_bounds[trading_type].get(symbol.upper(), (None, None))
+
+def is_listed(month, bounds):
+  first_month, last_month = bounds
+  return (first_month is None or month >= first_month) and (last_month is None or month <= last_month)
+
+def get_cache():
+  # one cache per store directory, shared by every -folder and date range below it
+  global _cache
+  with _cache_lock:
+    if _cache is None:
+      _cache = DownloadCache(get_destination_dir('download-cache.sqlite'))
+  return _cache
+
+def is_modified(download_url, etag):
+  # conditional request: a 304 means the published file still has the cached etag,
+  # any error keeps the local copy rather than replacing it
+  request = urllib.request.Request(download_url, method='HEAD', headers={'If-None-Match': etag})
+  try:
+    urllib.request.urlopen(request).close()
+  except (urllib.error.URLError, ConnectionError, TimeoutError):
+    return False
+  return True
+
+def link_file(source, save_path):
+  # hardlink identical content instead of storing another copy
+  tmp_path = save_path + '.link'
+  try:
+    os.link(source, tmp_path)
+  except OSError:
+    return False
+  os.replace(tmp_path, save_path)
+  return True
+
+def get_save_path(base_path, file_name, date_range=None, folder=None):
   if folder:
     base_path = os.path.join(folder, base_path)
   if date_range:
     date_range = date_range.replace(" ","_")
     base_path = os.path.join(base_path, date_range)
-  save_path = get_destination_dir(os.path.join(base_path, file_name), folder)
-  
+  return base_path, get_destination_dir(os.path.join(base_path, file_name), folder)
 
-  if os.path.exists(save_path):
-    print("\nfile already exists! {}".format(save_path))
-    return
+def download_file(base_path, file_name, date_range=None, folder=None, checksum=False, revalidate=False, overwrite=False, progress=True, retries=3):
+  download_path = "{}{}".format(base_path, file_name)
+  base_path, save_path = get_save_path(base_path, file_name, date_range, folder)
+  download_url = get_download_url(download_path)
+  cache = get_cache()
+  entry = cache.get(download_url)
+
+  if overwrite:
+    # the existing file is replaced once the new download is complete
+    entry = None
+  elif os.path.exists(save_path):
+    if not (revalidate and entry and entry['etag']):
+      print("\nfile already exists! {}".format(save_path))
+      return
+    if not is_modified(download_url, entry['etag']):
+      cache.touch(download_url)
+      print("\nfile not modified! {}".format(save_path))
+      return
+    # the file was republished upstream, fetch it again and replace the local copy once complete
+    print("\nfile modified upstream! {}".format(save_path))
+    entry = None
+    # a leftover .part may hold bytes of the old version, resuming it would splice the two together
+    if os.path.exists(save_path + '.part'):
+      os.remove(save_path + '.part')
   
   # make the directory
   if not os.path.exists(base_path):
     Path(get_destination_dir(base_path)).mkdir(parents=True, exist_ok=True)
 
-  try:
-    download_url = get_download_url(download_path)
-    dl_file = urllib.request.urlopen(download_url)
-    length = dl_file.getheader('content-length')
-    if length:
-      length = int(length)
-      blocksize = max(4096,length//100)
-
-    with open(save_path, 'wb') as out_file:
-      dl_progress = 0
+  # the same url may already be stored under another -folder or date range
+  if entry and os.path.exists(entry['path']) and os.path.getsize(entry['path']) == entry['size']:
+    if not (revalidate and entry['etag'] and is_modified(download_url, entry['etag'])):
+      if link_file(entry['path'], save_path):
+        print("\nfile linked from cache! {}".format(save_path))
+        return
+
+  expected = checksum_text = None
+  if checksum:
+    checksum_text = download_checksum(download_url, retries)
+    if checksum_text is None:
+      return
+    expected = checksum_text.split()[0].lower()
+
+  # data is written to a .part file first and only renamed once complete,
+  # so an interrupted transfer is resumed with a Range request instead of being kept or restarted
+  part_path = save_path + '.part'
+  for attempt in range(retries + 1):
+    try:
+      complete, digest, etag = _download_part(download_url, part_path, save_path, progress)
+      if not complete:
+        print("\nDownload interrupted, resuming: {}".format(download_url))
+        continue
+    except urllib.error.HTTPError as e:
+      if e.code != 416:
+        print("\nFile not found: {}".format(download_url))
+        return
+      # nothing left past the .part file: it is complete if the sizes agree, otherwise start over
+      total = e.headers.get('Content-Range', '').split('/')[-1]
+      if not total.isdigit() or int(total) != os.path.getsize(part_path):
+        os.remove(part_path)
+        continue
+      digest, etag = get_file_sha256(part_path).hexdigest(), None
+    except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+      print("\nDownload interrupted ({}), resuming: {}".format(e, download_url))
+      continue
+
+    if expected and digest != expected:
+      print("\nChecksum mismatch, downloading again: {}".format(download_url))
+      os.remove(part_path)
+      continue
+    os.replace(part_path, save_path)
+    if checksum_text is not None:
+      # the .CHECKSUM is only kept next to a complete download
+      with open(save_path + '.CHECKSUM', 'w') as f:
+        f.write(checksum_text)
+
+    size = os.path.getsize(save_path)
+    same = cache.find_content(digest, size, exclude=os.path.abspath(save_path))
+    if same:
+      link_file(same, save_path)
+    cache.put(download_url, etag, size, digest, save_path)
+    return size
+  print("\nDownload incomplete, kept partial file: {}".format(part_path))
+
+def download_checksum(download_url, retries=3):
+  # fetch the published .CHECKSUM before the data, retrying network errors like the data download,
+  # returns its text or None when it is not published or could not be fetched
+  checksum_url = download_url + '.CHECKSUM'
+  for attempt in range(retries + 1):
+    try:
+      return urllib.request.urlopen(checksum_url).read().decode()
+    except urllib.error.HTTPError:
+      print("\nFile not found: {}".format(checksum_url))
+      return None
+    except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+      error = e
+  print("\nCould not fetch checksum ({}): {}".format(error, checksum_url))
+  return None
+
+def get_file_sha256(path, sha256=None):
+  sha256 = sha256 or hashlib.sha256()
+  with open(path, 'rb') as f:
+    for buf in iter(lambda: f.read(1024 * 1024), b''):
+      sha256.update(buf)
+  return sha256
+
+def _download_part(download_url, part_path, save_path, progress):
+  # returns (complete, sha256 hexdigest of the whole file or None, etag)
+  offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+  request = urllib.request.Request(download_url)
+  if offset:
+    request.add_header('Range', 'bytes={}-'.format(offset))
+  dl_file = urllib.request.urlopen(request)
+  if dl_file.status != 206:
+    # the server ignored the range and sent the whole file
+    offset = 0
+
+  # the hash is computed while the bytes stream in, only a resumed prefix is read back from disk
+  sha256 = get_file_sha256(part_path) if offset else hashlib.sha256()
+
+  length = dl_file.getheader('content-length')
+  total = None
+  if length and length.isdigit():
+    total = offset + int(length)
+
+  # one fixed buffer is reused for every block, so memory does not grow with the file size
+  buffer = bytearray(BLOCK_SIZE)
+  view = memoryview(buffer)
+  with open(part_path, 'ab' if offset else 'wb') as out_file:
+    dl_progress = offset
+    if progress:
       print("\nFile Download: {}".format(save_path))
-      while True:
-        buf = dl_file.read(blocksize)   
-        if not buf:
-          break
-        dl_progress += len(buf)
-        out_file.write(buf)
-        done = int(50 * dl_progress / length)
+    while True:
+      size = dl_file.readinto(buffer)
+      if not size:
+        break
+      dl_progress += size
+      out_file.write(view[:size])
+      sha256.update(view[:size])
+      if progress and total:
+        done = int(50 * dl_progress / total)
         sys.stdout.write("\r[%s%s]" % ('#' * done, '.' * (50-done)) )    
         sys.stdout.flush()
 
-  except urllib.error.HTTPError:
-    print("\nFile not found: {}".format(download_url))
-    pass
+  complete = total is None or dl_progress == total
+  return complete, sha256.hexdigest() if complete else None, dl_file.getheader('etag')
+
+def download_files(jobs, concurrency=1):
+  # jobs are download_file() argument tuples: (base_path, file_name, date_range, folder[, checksum, revalidate, overwrite])
+  # at most `concurrency` transfers run at once, all of them against BASE_URL
+  if concurrency <= 1:
+    for job in jobs:
+      download_file(*job)
+    return
+  start = datetime.now()
+  stats = asyncio.run(_download_files(iter(jobs), len(jobs), concurrency, start))
+  elapsed = (datetime.now() - start).total_seconds() or 1
+  print("\nDownloaded {downloaded} files ({mb:.1f} MB), {skipped} skipped, {failed} failed in {elapsed:.1f}s"
+    " ({rate:.1f} files/s, {speed:.1f} MB/s)".format(
+      mb=stats['bytes'] / 2**20, elapsed=elapsed, rate=stats['done'] / elapsed,
+      speed=stats['bytes'] / 2**20 / elapsed, **stats))
+  return stats
+
+async def _download_files(jobs, total, concurrency, start):
+  loop = asyncio.get_running_loop()
+  stats = {'done': 0, 'downloaded': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+
+  async def worker(executor):
+    # workers share one iterator, so pending jobs are never materialised as tasks
+    for job in jobs:
+      try:
+        size = await loop.run_in_executor(executor, lambda: download_file(*job, progress=False))
+        # download_file() returns None for files it did not transfer: existing, linked or not published
+        stats['skipped' if size is None else 'downloaded'] += 1
+        stats['bytes'] += size or 0
+      except Exception as e:
+        print("\nFile download failed: {}{} ({})".format(job[0], job[1], e))
+        stats['failed'] += 1
+      stats['done'] += 1
+      elapsed = (datetime.now() - start).total_seconds() or 1
+      sys.stdout.write("\r[{}/{}] files, {:.1f} MB, {:.1f} MB/s".format(
+        stats['done'], total, stats['bytes'] / 2**20, stats['bytes'] / 2**20 / elapsed))
+      sys.stdout.flush()
+
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    await asyncio.gather(*(worker(executor) for _ in range(concurrency)))
+  return stats
+
+def get_dates(dates=None):
+  # the -d dates, or every day from PERIOD_START_DATE until today
+  if dates:
+    return dates
+  start = convert_to_date_object(PERIOD_START_DATE)
+  return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((END_DATE - start).days + 1)]
+
+def get_date_bounds(start_date, end_date):
+  # a -startDate/-endDate pair is also stored as the date range of the download folder
+  date_range = None
+  if start_date and end_date:
+    date_range = start_date + " " + end_date
+  start_date = convert_to_date_object(start_date) if start_date else START_DATE
+  end_date = convert_to_date_object(end_date) if end_date else END_DATE
+  return date_range, start_date, end_date
+
+def get_range_plan(start_date, end_date):
+  # years and days spanned by -startDate/-endDate, the job functions then split them with is_complete_month()
+  _, start_date, end_date = get_date_bounds(start_date, end_date)
+  years = [str(year) for year in range(start_date.year, end_date.year + 1)]
+  dates = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end_date - start_date).days + 1)]
+  return years, dates
+
+def is_range_plan(args):
+  # -startDate alone selects the period, with -y or -m the range only filters those years and months
+  # like before, and nothing is split when dates are given or monthly or daily files are skipped
+  return bool(args.startDate) and not args.dates and args.skip_monthly == 0 and args.skip_daily == 0 \
+    and args.years == YEARS and args.months == MONTHS
+
+def is_complete_month(year, month, start_date, end_date):
+  # the range covers every day of the month and the month is over, so its monthly archive is published
+  first_day = date(int(year), int(month), 1)
+  next_month = (first_day + timedelta(days=32)).replace(day=1)
+  return first_day >= start_date and next_month - timedelta(days=1) <= end_date and next_month <= END_DATE
+
+def get_file_name(symbol, market_data_type, interval, period):
+  # klines are named after their interval, trades and aggTrades after the data type
+  return "{}-{}-{}.zip".format(symbol.upper(), interval or market_data_type, period)
+
+def get_monthly_jobs(trading_type, market_data_type, symbol, intervals, years, months, start_date, end_date, folder, checksum, revalidate, plan=False):
+  # download_files() jobs for the monthly archives of one symbol, intervals is None for trades and aggTrades
+  # with plan only the months complete within the range, the rest is left to the daily files,
+  # intervals without daily files (3d, 1w, 1mo) keep every month the range touches
+  date_range, start_date, end_date = get_date_bounds(start_date, end_date)
+  bounds = get_symbol_bounds(trading_type, symbol)
+  jobs = []
+  for interval in intervals or [None]:
+    has_daily = interval is None or interval in DAILY_INTERVALS
+    first_date = start_date.replace(day=1) if plan and not has_daily else start_date
+    for year in years:
+      for month in months:
+        current_date = convert_to_date_object('{}-{}-01'.format(year, month))
+        if plan and has_daily and not is_complete_month(year, month, start_date, end_date):
+          continue
+        if not is_listed(current_date.strftime("%Y-%m"), bounds):
+          continue
+        if current_date >= first_date and current_date <= end_date:
+          path = get_path(trading_type, market_data_type, "monthly", symbol, interval)
+          file_name = get_file_name(symbol, market_data_type, interval, '{}-{:02d}'.format(year, int(month)))
+          jobs.append((path, file_name, date_range, folder, checksum == 1, revalidate == 1))
+  return jobs
+
+def get_daily_jobs(trading_type, market_data_type, symbol, intervals, dates, start_date, end_date, folder, checksum, revalidate, plan=False):
+  # download_files() jobs for the daily archives of one symbol, only DAILY_INTERVALS exist as daily files
+  # with plan the days of months covered by a monthly archive are skipped
+  date_range, start_date, end_date = get_date_bounds(start_date, end_date)
+  if intervals:
+    intervals = [interval for interval in intervals if interval in DAILY_INTERVALS]
+  bounds = get_symbol_bounds(trading_type, symbol)
+  jobs = []
+  for interval in intervals or ([None] if intervals is None else []):
+    for date in dates:
+      current_date = convert_to_date_object(date)
+      if plan and is_complete_month(current_date.year, current_date.month, start_date, end_date):
+        continue
+      if not is_listed(date[:7], bounds):
+        continue
+      if current_date >= start_date and current_date <= end_date:
+        path = get_path(trading_type, market_data_type, "daily", symbol, interval)
+        file_name = get_file_name(symbol, market_data_type, interval, date)
+        jobs.append((path, file_name, date_range, folder, checksum == 1, revalidate == 1))
+  return jobs
 
 def convert_to_date_object(d):
   year, month, day = [int(x) for x in d.split('-')]
@@ -144,6 +543,12 @@ def get_parser(parser_type):
   parser.add_argument(
       '-c', dest='checksum', default=0, type=int, choices=[0,1],
       help='1 to download checksum file, default 0')
+  parser.add_argument(
+      '-revalidate', dest='revalidate', default=0, type=int, choices=[0, 1],
+      help='1 to check existing files against the server and download them again if they were republished, default 0')
+  parser.add_argument(
+      '-concurrency', '--concurrency', dest='concurrency', default=1, type=int,
+      help='Number of files to download at the same time, default 1')
   parser.add_argument(
       '-t', dest='type', required=True, choices=TRADING_TYPE,
       help='Valid trading types: {}'.format(TRADING_TYPE))
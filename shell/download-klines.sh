@@ -9,14 +9,26 @@ months=(01 02 03 04 05 06 07 08 09 10 11 12)
 
 baseurl="https://data.binance.vision/data/spot/monthly/klines"
 
+# urls that returned 404 for a month closed more than a week ago, they are not requested again on the next run
+missing_file="missing-urls.txt"
+touch ${missing_file}
+
 for symbol in ${symbols[@]}; do
   for interval in ${intervals[@]}; do
     for year in ${years[@]}; do
       for month in ${months[@]}; do
         url="${baseurl}/${symbol}/${interval}/${symbol}-${interval}-${year}-${month}.zip"
+        if grep -qxF "${url}" ${missing_file}; then
+          continue
+        fi
         response=$(wget --server-response -q ${url} 2>&1 | awk 'NR==1{print $2}')
         if [ ${response} == '404' ]; then
           echo "File not exist: ${url}" 
+          # monthly files are published a few days after the month ends, only record a 404 after that
+          closed=$(date -d "${year}-${month}-01 +1 month +7 days" +%s)
+          if [ $(date +%s) -gt ${closed} ]; then
+            echo "${url}" >> ${missing_file}
+          fi
         else
           echo "downloaded: ${url}"
         fi
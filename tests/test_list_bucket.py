@@ -0,0 +1,94 @@
+"""
+_parse_list_bucket和_list_bucket的翻页，用fixtures中S3 ListBucket格式的xml，不访问网络
+"""
+import os
+
+import pytest
+
+from binance_public_data import BinancePublicData
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture
+def data():
+    return BinancePublicData()
+
+
+def test_truncated_page_with_next_marker(data):
+    prefixes, contents, next_page = data._parse_list_bucket(read_fixture('list_bucket_next_marker.xml'))
+    assert prefixes == [
+        'data/spot/monthly/klines/1INCHBTC/',
+        'data/spot/monthly/klines/AAVEUSDT/',
+        'data/spot/monthly/klines/ACMUSDT/',
+    ]
+    assert contents == []
+    assert next_page == {'marker': 'data/spot/monthly/klines/ACMUSDT/'}
+
+
+def test_truncated_page_without_next_marker(data):
+    # 没有NextMarker时用这一页最大的key继续
+    prefixes, contents, next_page = data._parse_list_bucket(read_fixture('list_bucket_no_next_marker.xml'))
+    assert prefixes == []
+    assert [c['key'] for c in contents] == [
+        'data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2017-08.zip',
+        'data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2017-08.zip.CHECKSUM',
+        'data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2017-09.zip',
+        'data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2017-09.zip.CHECKSUM',
+    ]
+    assert contents[0]['size'] == 453542
+    assert contents[0]['etag'] == '6bf5fe3ed5ba4e1e8a4f5fb0a0a5d3c1'
+    assert next_page == {'marker': 'data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2017-09.zip.CHECKSUM'}
+
+
+def test_continuation_token_page(data):
+    prefixes, contents, next_page = data._parse_list_bucket(read_fixture('list_bucket_continuation.xml'))
+    assert prefixes == []
+    assert [(c['key'], c['size']) for c in contents] == [
+        ('data/futures/um/monthly/klines/BTCUSDT/1h/BTCUSDT-1h-2020-01.zip', 36012),
+        ('data/futures/um/monthly/klines/BTCUSDT/1h/BTCUSDT-1h-2020-01.zip.CHECKSUM', 89),
+    ]
+    assert next_page == {'continuation-token': '1ueGcxLPRx1Tr/XYExHnhbYLgveDs2J/wm36Hy4vbOwM='}
+
+
+def test_last_page(data):
+    _, contents, next_page = data._parse_list_bucket(read_fixture('list_bucket_last_page.xml'))
+    assert [c['key'] for c in contents] == ['data/futures/um/monthly/klines/BTCUSDT/1h/BTCUSDT-1h-2020-02.zip']
+    assert next_page is None
+
+
+class Response:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.mark.parametrize('pages, expected_params', [
+    (['list_bucket_no_next_marker.xml', 'list_bucket_last_page.xml'],
+     {'marker': 'data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2017-09.zip.CHECKSUM'}),
+    (['list_bucket_continuation.xml', 'list_bucket_last_page.xml'],
+     {'continuation-token': '1ueGcxLPRx1Tr/XYExHnhbYLgveDs2J/wm36Hy4vbOwM='}),
+])
+def test_list_bucket_follows_pages(data, monkeypatch, pages, expected_params):
+    requests = []
+
+    def request(url, params=None, **kwargs):
+        requests.append(params)
+        return Response(read_fixture(pages[len(requests) - 1]))
+
+    monkeypatch.setattr(data, '_request', request)
+    prefixes, contents = data._list_bucket('spot', 'data/spot/monthly/klines/BTCUSDT/1m/')
+
+    assert len(requests) == 2
+    assert requests[0] == {'delimiter': '/', 'prefix': 'data/spot/monthly/klines/BTCUSDT/1m/'}
+    assert requests[1] == {'delimiter': '/', 'prefix': 'data/spot/monthly/klines/BTCUSDT/1m/', **expected_params}
+    assert len(contents) == len(data._parse_list_bucket(read_fixture(pages[0]))[1]) + 1
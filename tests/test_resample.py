@@ -0,0 +1,70 @@
+"""
+_resample合成高周期k线: 1h、1w(周一开始)、1mo(自然月)，最后一根没有走完的k线不输出
+输入的第i根k线开盘价为i，期望结果在fixtures/resample_expected.csv中
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from binance_public_data import BinancePublicData
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def make_klines(start, periods, freq):
+    i = np.arange(periods, dtype='float64')
+    return pd.DataFrame({
+        'candle_begin_time': pd.date_range(start, periods=periods, freq=freq),
+        'open': i,
+        'high': i + 1,
+        'low': i - 1,
+        'close': i + 0.5,
+        'volume': 1.0,
+        'quote/base_asset_volume': 2.0,
+        'num_of_trades': 3,
+        'Taker_buy_base_asset_volume': 0.5,
+        'Taker_buy_quote_asset_volume': 1.0,
+    })
+
+
+def assert_klines_equal(result, expected):
+    # 时间的精度(ms/us/ns)随pandas版本不同，只比较时间本身
+    result = result.astype({'candle_begin_time': 'datetime64[ns]'})
+    expected = expected.astype({'candle_begin_time': 'datetime64[ns]'})
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def read_expected(interval):
+    expected = pd.read_csv(os.path.join(FIXTURES, 'resample_expected.csv'), parse_dates=['candle_begin_time'])
+    expected = expected[expected['interval'] == interval].drop(columns='interval')
+    return expected.reset_index(drop=True)
+
+
+@pytest.fixture
+def data():
+    return BinancePublicData()
+
+
+@pytest.mark.parametrize('periods', [
+    150,  # 2020-02-01 00:00这根1h只有30分钟，不输出
+    120,  # 最后一根1h正好走完，输出
+])
+def test_resample_1h(data, periods):
+    df = make_klines('2020-01-31 22:00', periods, 'min')
+    result = data._resample(df, '1h', '1m')
+    assert_klines_equal(result, read_expected('1h'))
+
+
+@pytest.mark.parametrize('interval', ['1w', '1mo'])
+def test_resample_week_and_month(data, interval):
+    # 2020-01-27(周一)到2020-03-04 05:00的1h k线，3月2日开始的周线和3月的月线没有走完
+    df = make_klines('2020-01-27', 894, 'h')
+    result = data._resample(df, interval, '1h')
+    assert_klines_equal(result, read_expected(interval))
+
+
+def test_resample_drops_only_incomplete_bar(data):
+    df = make_klines('2020-02-01 00:00', 30, 'min')
+    assert data._resample(df, '1h', '1m').empty